@@ -2,6 +2,7 @@
 import streamlit as st
 import os
 import sys
+import uuid
 from PIL import Image
 from google import genai
 
@@ -32,7 +33,48 @@ if "generated_word" not in st.session_state:
 if "generated_filename" not in st.session_state:
     st.session_state.generated_filename = "worksheet"
 
-generator = WorksheetGenerator(ai_api_key=st.session_state.api_key, provider=st.session_state.api_provider)
+# Stable per-session id so the AI request scheduler can queue sessions fairly
+if "session_id" not in st.session_state:
+    st.session_state.session_id = uuid.uuid4().hex
+
+# Optional backup providers (from secrets), tried in this order if the selected one fails
+FALLBACK_SECRET_KEYS = [("Groq", "GROQ_API_KEY"), ("Google Gemini", "GEMINI_API_KEY"), ("OpenRouter", "OPENROUTER_API_KEY")]
+
+def get_fallback_providers():
+    """Read backup provider keys from st.secrets"""
+    fallbacks = []
+    for provider_name, secret_name in FALLBACK_SECRET_KEYS:
+        try:
+            key = st.secrets.get(secret_name, None)
+        except:
+            key = None
+        if key:
+            fallbacks.append((provider_name, key))
+    return fallbacks
+
+fallback_providers = get_fallback_providers()
+
+# Gemini connection pool settings (from secrets); unset ones keep GoogleProvider's defaults
+PROVIDER_OPTION_SECRETS = [("Google Gemini", "pool_size", "GEMINI_POOL_SIZE", int),
+                           ("Google Gemini", "keepalive_expiry", "GEMINI_KEEPALIVE_EXPIRY", float)]
+
+def get_provider_options():
+    """Read per-provider constructor options from st.secrets"""
+    options = {}
+    for provider_name, option, secret_name, convert in PROVIDER_OPTION_SECRETS:
+        try:
+            value = st.secrets.get(secret_name, None)
+            if value is not None:
+                options.setdefault(provider_name, {})[option] = convert(value)
+        except Exception:
+            pass
+    return options
+
+ai_provider_options = get_provider_options()
+
+generator = WorksheetGenerator(ai_api_key=st.session_state.api_key, provider=st.session_state.api_provider,
+                               session_id=st.session_state.session_id, fallback_providers=fallback_providers,
+                               provider_options=ai_provider_options)
 
 st.set_page_config(page_title="โปรแกรมสร้างใบงาน EasyWorksheet", page_icon="🚀", layout="wide")
 
@@ -102,7 +144,10 @@ if st.session_state.api_key:
         st.session_state.generator.provider != st.session_state.api_provider):
         st.session_state.generator = WorksheetGenerator(
             ai_api_key=st.session_state.api_key, 
-            provider=st.session_state.api_provider
+            provider=st.session_state.api_provider,
+            session_id=st.session_state.session_id,
+            fallback_providers=fallback_providers,
+            provider_options=ai_provider_options
         )
 
 # Use cached generator
@@ -186,6 +231,20 @@ def check_ai_and_generate(generator, generate_func, *args, **kwargs):
         st.info("💡 หากต้องการใช้ AI กรุณาตรวจสอบ API Key ที่ด้านบนนะคะ")
         return None  # Will be handled by caller
 
+def stream_with_live_preview(generator, subject, topic, grade, num_q, exercise_type="mix"):
+    """Generate a worksheet, showing each question/answer pair as soon as the AI writes it"""
+    live_preview = st.empty()
+    questions, answers = [], []
+    for question, answer in generator.stream_subject_worksheet(subject, topic, grade, num_q, exercise_type):
+        questions.append(question)
+        answers.append(answer)
+        with live_preview.container():
+            st.markdown(f"**📝 กำลังสร้าง... ({len(questions)}/{num_q} ข้อ)**")
+            for i, q in enumerate(questions[-5:], len(questions) - min(len(questions), 5) + 1):
+                st.write(f"**{i}.** {q}")
+    live_preview.empty()
+    return questions, answers
+
 # --- Main Content Area ---
 
 if "ทดสอบ AI" in mode_select:
@@ -198,7 +257,9 @@ if "ทดสอบ AI" in mode_select:
         # Initialize generator to test
         test_generator = WorksheetGenerator(
             ai_api_key=st.session_state.api_key, 
-            provider=st.session_state.api_provider
+            provider=st.session_state.api_provider,
+            session_id=st.session_state.session_id,
+            provider_options=ai_provider_options
         )
         
         # Connection Status
@@ -210,7 +271,7 @@ if "ทดสอบ AI" in mode_select:
             st.info(f"**Provider:** {st.session_state.api_provider}")
         
         with col2:
-            if test_generator.is_ai_working():
+            if test_generator.check_ai_health():
                 st.success("**Status:** ✅ เชื่อมต่อสำเร็จ!")
             else:
                 st.error("**Status:** ❌ ไม่สามารถเชื่อมต่อได้")
@@ -669,7 +730,7 @@ if "คณิตศาสตร์" in mode_select:
                         c1.download_button("📄 ดาวน์โหลด PDF", pdf, "summary.pdf", "application/pdf")
                         c2.download_button("📝 ดาวน์โหลด Word", word, "summary.docx", "application/vnd.openxmlformats-officedocument.wordprocessingml.document")
                     else:
-                        questions, answers = generator.generate_quiz_from_text(summarized, num_q)
+                        questions, answers = generator.generate_quiz_from_text(summarized, num_q, topic=selected_topic, grade=grade_select)
                         
                         pdf = generator.create_pdf(title, school_name, "Quiz from File", questions, answers, qr_url, uploaded_logo)
                         word = generator.create_word_doc(title, school_name, "Quiz from File", questions, answers)
@@ -1054,16 +1115,12 @@ elif "วิทยาศาสตร์" in mode_select:
                         }
                         
                         if science_grade in ["ม.4", "ม.5", "ม.6"]:
-                            if subject_key == "เคมี":
-                                questions, answers = generator.generate_chemistry_worksheet(selected_science_topic, science_grade, num_q)
-                            elif subject_key == "ฟิสิกส์":
-                                questions, answers = generator.generate_physics_worksheet(selected_science_topic, science_grade, num_q)
-                            elif subject_key == "ชีววิทยา":
-                                questions, answers = generator.generate_biology_worksheet(selected_science_topic, science_grade, num_q)
-                            else:
-                                questions, answers = generator.generate_science_worksheet(selected_science_topic, science_grade, num_q)
+                            science_subjects = {"เคมี": "Chemistry", "ฟิสิกส์": "Physics", "ชีววิทยา": "Biology"}
+                            questions, answers = stream_with_live_preview(
+                                generator, science_subjects.get(subject_key, "Science"), selected_science_topic, science_grade, num_q)
                         else:
-                            questions, answers = generator.generate_science_worksheet(selected_science_topic, grade_context.get(science_grade, science_grade), num_q)
+                            questions, answers = stream_with_live_preview(
+                                generator, "Science", selected_science_topic, grade_context.get(science_grade, science_grade), num_q)
                         
                         pdf = generator.create_pdf(title, school_name, selected_science_topic, questions, answers, qr_url, uploaded_logo)
                         word = generator.create_word_doc(title, school_name, selected_science_topic, questions, answers)
@@ -1108,7 +1165,7 @@ elif "วิทยาศาสตร์" in mode_select:
                         c1.download_button("📄 ดาวน์โหลด PDF", pdf, "summary.pdf", "application/pdf")
                         c2.download_button("📝 ดาวน์โหลด Word", word, "summary.docx", "application/vnd.openxmlformats-officedocument.wordprocessingml.document")
                     else:
-                        questions, answers = generator.generate_quiz_from_text(summarized, num_q)
+                        questions, answers = generator.generate_quiz_from_text(summarized, num_q, topic=selected_science_topic, grade=science_grade)
                         
                         pdf = generator.create_pdf(title, school_name, "Quiz from File", questions, answers, qr_url, uploaded_logo)
                         word = generator.create_word_doc(title, school_name, "Quiz from File", questions, answers)
@@ -1378,7 +1435,9 @@ elif "ภาษาไทย" in mode_select:
                     "วรรณคดี (Literature)": "literature"
                 }
                 
-                questions, answers = generator.generate_thai_worksheet(
+                questions, answers = stream_with_live_preview(
+                    generator,
+                    "Thai Language",
                     selected_thai_topic, 
                     selected_thai_grade,
                     num_q,
@@ -1934,7 +1993,9 @@ elif "สังคมศึกษา" in mode_select:
                     "การสร้างสรรค์ (Creation)": "creation"
                 }
                 
-                questions, answers = generator.generate_social_studies_worksheet(
+                questions, answers = stream_with_live_preview(
+                    generator,
+                    "Social Studies",
                     selected_social_topic, 
                     social_grade_select,
                     num_q,
@@ -2081,6 +2142,18 @@ elif "สร้างข้อสอบจากไฟล์" in mode_select:
     else:
         uploaded_file = st.file_uploader("อัปโหลดเอกสารประกอบการสอน (PDF หรือ Docx)", type=["pdf", "docx"])
         num_q = st.number_input("จำนวนข้อสอบที่ต้องการ", min_value=1, max_value=50, value=5)
+        quiz_topic = st.text_input(
+            "หัวข้อที่ต้องการเน้น (ไม่บังคับ)",
+            value="",
+            placeholder="เช่น การสังเคราะห์ด้วยแสง",
+            help="ไฟล์ยาวจะเลือกเฉพาะเนื้อหาที่เกี่ยวกับหัวข้อนี้มาออกข้อสอบ (เว้นว่าง = เลือกส่วนที่สำคัญที่สุดของไฟล์)"
+        )
+        page_range = st.text_input(
+            "เลือกหน้า (เฉพาะ PDF, ไม่บังคับ)",
+            value="",
+            placeholder="เช่น 1-10, 15 (เว้นว่าง = ทุกหน้า)",
+            help="อ่านเฉพาะหน้าที่เลือก เช่น บทที่ต้องการ ช่วยให้ไฟล์ใหญ่ประมวลผลเร็วขึ้น"
+        )
         
         # Custom Prompt Section
         with st.expander("✏️ ปรับแต่ง Prompt (ไม่บังคับ)", expanded=False):
@@ -2096,12 +2169,12 @@ elif "สร้างข้อสอบจากไฟล์" in mode_select:
         
         if uploaded_file and st.button("🚀 สร้างข้อสอบจากไฟล์", type="primary"):
             with st.spinner("AI กำลังอ่านไฟล์และออกข้อสอบ..."):
-                text = generator.extract_text_from_file(uploaded_file)
+                text = generator.extract_text_from_file(uploaded_file, pages=page_range.strip() or None)
                 
                 if not text or "Error" in text:
                     st.error(f"อ่านไฟล์ล้มเหลว: {text}")
                 else:
-                    questions, answers = generator.generate_quiz_from_text(text, num_q)
+                    questions, answers = generator.generate_quiz_from_text(text, num_q, topic=quiz_topic.strip() or None)
                     
                     pdf = generator.create_pdf(title, school_name, "Quiz", questions, answers, qr_url, uploaded_logo)
                     word = generator.create_word_doc(title, school_name, "Quiz", questions, answers)
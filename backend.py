@@ -18,7 +18,10 @@ from docx import Document
 from docx.shared import Pt, Inches, Cm
 from docx.enum.text import WD_ALIGN_PARAGRAPH
 from PIL import Image
-from pypdf import PdfReader
+from backend.ai_providers import key_fingerprint
+from backend.document_text import extract_document_text
+from backend.model_discovery import discover_models, select_by_priority
+from backend.response_parser import parse_questions
 
 # Import Groq for Groq support
 try:
@@ -45,45 +48,15 @@ class WorksheetGenerator:
             try:
                 client = genai.Client(api_key=ai_api_key)
 
-                # Smart Model Detection (Free Tier Compatible Models)
-                model_priority = [
-                    'gemini-1.5-flash',      # Best for Free Tier - fast & quota-friendly
-                    'gemini-1.5-pro',       # Free Tier available
-                    'gemini-2.0-flash-exp', # New model (if available)
-                ]
-
+                # Smart Model Detection (Free Tier Compatible Models), cached on disk
                 try:
-                    # List available models
-                    available_models = [m.name for m in client.models.list() if 'generateContent' in m.supported_generation_methods]
+                    available_models = discover_models(client, key_fingerprint(ai_api_key))
                     print(f"Available models: {available_models}")
 
-                    # Find first matching model from priority list
-                    for model_name in model_priority:
-                        for available in available_models:
-                            if model_name in available:
-                                self.client = client
-                                self.model_name = available
-                                print(f"[OK] Using AI Model: {available}")
-                                break
-                        if self.client:
-                            break
-
-                    # If still no model, use first available (fallback)
-                    if not self.client and available_models:
-                        # Prefer flash model if available
-                        for m in available_models:
-                            if 'flash' in m.lower():
-                                self.client = client
-                                self.model_name = m
-                                print(f"[OK] Using Flash Model (fallback): {m}")
-                                break
-                        
-                        # If no flash found, use first available
-                        if not self.client:
-                            self.client = client
-                            self.model_name = available_models[0]
-                            print(f"[OK] Using first available model: {available_models[0]}")
-                            
+                    self.model_name = select_by_priority(available_models)
+                    if self.model_name:
+                        self.client = client
+                        print(f"[OK] Using AI Model: {self.model_name}")
                 except Exception as e:
                     print(f"[!] Model detection failed: {e}")
                     # Last resort fallback - try flash explicitly
@@ -181,21 +154,14 @@ class WorksheetGenerator:
         else:
             raise Exception(f"No valid API configuration for {self.provider}")
 
+    def _parse_qa(self, resp_text):
+        """Questions and answers from an AI response, parsed in one pass"""
+        items = parse_questions(resp_text or "")
+        return [item.text for item in items], [item.answer or "" for item in items]
+
     def extract_text_from_file(self, uploaded_file):
         """Extracts text from PDF or Docx."""
-        text = ""
-        try:
-            if uploaded_file.name.endswith(".pdf"):
-                reader = PdfReader(uploaded_file)
-                for page in reader.pages:
-                    text += page.extract_text() + "\n"
-            elif uploaded_file.name.endswith(".docx"):
-                doc = Document(uploaded_file)
-                for para in doc.paragraphs:
-                    text += para.text + "\n"
-        except Exception as e:
-            return f"Error extracting text: {e}"
-        return text
+        return extract_document_text(uploaded_file)
 
     def generate_ai_worksheet(self, topic, grade_level, num_questions=10):
         """Generates worksheets for non-calculation topics using AI."""
@@ -286,11 +252,7 @@ class WorksheetGenerator:
 
         try:
             resp_text = self._generate_content(full_prompt)
-            qs, ans = [], []
-            for line in resp_text.split('\n'):
-                if line.startswith("Q:"): qs.append(line.replace("Q:", "").strip())
-                elif line.startswith("A:"): ans.append(line.replace("A:", "").strip())
-            return qs, ans
+            return self._parse_qa(resp_text)
         except Exception as e:
             return [f"AI Error: {str(e)}"], ["Error"]
 
@@ -317,28 +279,8 @@ class WorksheetGenerator:
         """
         try:
             content = self._generate_content(prompt)
-            # Parse is tricky, let's keep it simple string list for PDF now
-            # We will split by "Q:"
-            questions = []
-            answers = [] # We can store correct answers separately if needed
-
-            raw_qs = content.split("Q:")
-            for raw in raw_qs:
-                if not raw.strip(): continue
-                lines = raw.strip().split('\n')
-                q_text = lines[0].strip()
-                options = []
-                correct = ""
-                for line in lines[1:]:
-                    if line.startswith("Ans:"): correct = line.replace("Ans:", "").strip()
-                    elif line.strip(): options.append(line.strip())
-
-                if q_text:
-                    full_q = q_text + "\n" + "\n".join(options)
-                    questions.append(full_q)
-                    answers.append(correct)
-
-            return questions, answers
+            # Options A-D are folded into the question text, Ans: letter is the answer
+            return self._parse_qa(content)
         except Exception as e:
             return [f"AI Error: {str(e)}"], ["Error"]
 
@@ -376,11 +318,7 @@ class WorksheetGenerator:
         prompt = f"Generate {num_questions} math word problems (Thai) for {grade_level} about '{topic}'. Output format:\nQ: [Question]\nA: [Answer]"
         try:
             resp_text = self._generate_content(prompt)
-            qs, ans = [], []
-            for line in resp_text.split('\n'):
-                if line.startswith("Q:"): qs.append(line.replace("Q:", "").strip())
-                elif line.startswith("A:"): ans.append(line.replace("A:", "").strip())
-            return qs, ans
+            return self._parse_qa(resp_text)
         except Exception as e:
             return [f"Error: {str(e)}"], ["Error"]
 
@@ -533,11 +471,7 @@ class WorksheetGenerator:
 
         try:
             resp_text = self._generate_content(full_prompt)
-            qs, ans = [], []
-            for line in resp_text.split('\n'):
-                if line.startswith("Q:"): qs.append(line.replace("Q:", "").strip())
-                elif line.startswith("A:"): ans.append(line.replace("A:", "").strip())
-            return qs, ans
+            return self._parse_qa(resp_text)
         except Exception as e:
             return [f"AI Error: {str(e)}"], ["Error"]
 
@@ -587,11 +521,7 @@ class WorksheetGenerator:
 
         try:
             resp_text = self._generate_content(full_prompt)
-            qs, ans = [], []
-            for line in resp_text.split('\n'):
-                if line.startswith("Q:"): qs.append(line.replace("Q:", "").strip())
-                elif line.startswith("A:"): ans.append(line.replace("A:", "").strip())
-            return qs, ans
+            return self._parse_qa(resp_text)
         except Exception as e:
             return [f"AI Error: {str(e)}"], ["Error"]
 
@@ -644,11 +574,7 @@ class WorksheetGenerator:
 
         try:
             resp_text = self._generate_content(full_prompt)
-            qs, ans = [], []
-            for line in resp_text.split('\n'):
-                if line.startswith("Q:"): qs.append(line.replace("Q:", "").strip())
-                elif line.startswith("A:"): ans.append(line.replace("A:", "").strip())
-            return qs, ans
+            return self._parse_qa(resp_text)
         except Exception as e:
             return [f"AI Error: {str(e)}"], ["Error"]
 
@@ -703,11 +629,7 @@ class WorksheetGenerator:
 
         try:
             resp_text = self._generate_content(full_prompt)
-            qs, ans = [], []
-            for line in resp_text.split('\n'):
-                if line.startswith("Q:"): qs.append(line.replace("Q:", "").strip())
-                elif line.startswith("A:"): ans.append(line.replace("A:", "").strip())
-            return qs, ans
+            return self._parse_qa(resp_text)
         except Exception as e:
             return [f"AI Error: {str(e)}"], ["Error"]
 
@@ -877,11 +799,7 @@ class WorksheetGenerator:
 
         try:
             resp_text = self._generate_content(full_prompt)
-            qs, ans = [], []
-            for line in resp_text.split('\n'):
-                if line.startswith("Q:"): qs.append(line.replace("Q:", "").strip())
-                elif line.startswith("A:"): ans.append(line.replace("A:", "").strip())
-            return qs, ans
+            return self._parse_qa(resp_text)
         except Exception as e:
             return [f"AI Error: {str(e)}"], ["Error"]
 
@@ -1074,11 +992,7 @@ class WorksheetGenerator:
 
         try:
             resp_text = self._generate_content(full_prompt)
-            qs, ans = [], []
-            for line in resp_text.split('\n'):
-                if line.startswith("Q:"): qs.append(line.replace("Q:", "").strip())
-                elif line.startswith("A:"): ans.append(line.replace("A:", "").strip())
-            return qs, ans
+            return self._parse_qa(resp_text)
         except Exception as e:
             return [f"AI Error: {str(e)}"], ["Error"]
 
@@ -1,3 +1,4 @@
 # __init__.py - Backend package
 from .ai_providers import create_ai_provider, GoogleProvider, GroqProvider, OpenRouterProvider
+from .provider_registry import get_shared_provider, get_provider_registry
 from .worksheet_generator import WorksheetGenerator
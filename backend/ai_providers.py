@@ -1,175 +1,511 @@
 # ai_providers.py - AI Provider integrations (Google, Groq, OpenRouter)
+import asyncio
+import hashlib
+import importlib.util
+import threading
+import time
+
 from google import genai
+from google.genai import types
+
+from .latency import LatencyHistogram
+from .model_discovery import (BENCHMARK_INTERVAL, discover_models, get_cache_entry,
+                              run_benchmark, select_by_priority)
+from .rate_limiter import get_scheduler, estimate_tokens
+from .resilience import AUTH, QUOTA, TRANSIENT, CircuitBreaker, RetryPolicy, classify_error
+
+# How long a health check result is trusted before a new probe is allowed
+HEALTH_CHECK_TTL = 300
+
+# Scheduler session for background model benchmarks (queued fairly behind users)
+BENCHMARK_SESSION = "model-benchmark"
+
+# Health results are shared by every provider object using the same key,
+# so Streamlit reruns that rebuild the generator don't probe again
+_health_cache = {}
+_health_threads = {}
+_health_lock = threading.Lock()
+
+
+def key_fingerprint(api_key):
+    """Non-reversible fingerprint of an API key (full SHA-256, so keys never collide)"""
+    return hashlib.sha256((api_key or "").encode("utf-8")).hexdigest()
 
-class GoogleProvider:
-    def __init__(self, api_key):
+
+def chat_request(model, prompt, max_tokens=None, json_schema=None):
+    """Arguments for an OpenAI-style chat completion (Groq, OpenRouter)"""
+    request = {
+        "messages": [
+            {"role": "system", "content": "You are a helpful Thai education assistant."},
+            {"role": "user", "content": prompt}
+        ],
+        "model": model,
+        "temperature": 0.7,
+    }
+    if max_tokens:
+        request["max_tokens"] = max_tokens
+    if json_schema:
+        # JSON object mode is available on every routed model; the prompt describes the shape
+        request["response_format"] = {"type": "json_object"}
+    return request
+
+
+class BaseProvider:
+    """Shared lazy initialization, health checks, retries and circuit breaking for AI providers"""
+    name = "AI"
+    # Whether generate(json_schema=...) returns JSON rather than free text
+    supports_json_schema = False
+
+    def __init__(self, api_key, retry_policy=None, circuit_breaker=None):
         self.api_key = api_key
-        self.model = None
-        self.model_name = None
-        self.is_working = False
-        self._init_model()
-    
-    def _init_model(self):
+        self.client = None
+        self._client_lock = threading.Lock()
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.breaker = circuit_breaker or CircuitBreaker()
+        # Duration of successful API calls (excluding rate-limit queueing)
+        self.latency = LatencyHistogram()
+        # Rate limits apply per key, so every object for this key shares one scheduler
+        self.scheduler = get_scheduler(self.name, key_fingerprint(api_key))
+        # No network here: trust a cached probe result, otherwise assume the
+        # provider works as long as its library is installed
+        self._client_ok = self._library_available()
+        # Only a rejected key keeps new objects for it off; other probe
+        # failures (a timeout, a 5xx) may already be over
+        entry = self._health_entry()
+        if entry and entry[2] == AUTH:
+            self.breaker.trip()
+
+    @property
+    def is_working(self):
+        """Client can be built and the circuit breaker would let a request through"""
+        return self._client_ok and self.breaker.is_available()
+
+    @is_working.setter
+    def is_working(self, value):
+        self._client_ok = value
+
+    def _library_available(self):
+        return True
+
+    def _create_client(self):
+        """Build the SDK client (must not make network calls)"""
+        raise NotImplementedError
+
+    def _probe(self):
+        """Make a cheap live call; raise on failure"""
+        raise NotImplementedError
+
+    def _ensure_client(self):
+        """Create the client on first use"""
+        if self.client is None:
+            with self._client_lock:
+                if self.client is None:
+                    try:
+                        self.client = self._create_client()
+                    except ImportError:
+                        print(f"[!] {self.name} library not installed")
+                        self.is_working = False
+                    except Exception as e:
+                        print(f"[!] {self.name} init failed: {e}")
+                        self.is_working = False
+        return self.client
+
+    # ===== Health Checks =====
+    def _health_key(self):
+        return (self.name, key_fingerprint(self.api_key))
+
+    def _health_entry(self):
+        # (ok, checked_at, error kind or None) if still fresh, else None
+        with _health_lock:
+            entry = _health_cache.get(self._health_key())
+        if entry and time.time() - entry[1] < HEALTH_CHECK_TTL:
+            return entry
+        return None
+
+    def cached_health(self):
+        """Return the last probe result if it is still fresh, else None"""
+        entry = self._health_entry()
+        return entry[0] if entry else None
+
+    def _record_health(self, ok, kind=None):
+        # A successful call also counts as a passed probe, so a stale failure
+        # stops being reported once requests go through again
+        with _health_lock:
+            _health_cache[self._health_key()] = (ok, time.time(), kind)
+        if ok:
+            self.breaker.record_success()
+        elif kind == AUTH:
+            self.breaker.trip()
+        else:
+            self.breaker.record_failure()
+
+    def _run_probe(self):
         try:
-            client = genai.Client(api_key=self.api_key)
-            model_priority = [
-                'gemini-1.5-flash',
-                'gemini-1.5-pro',
-                'gemini-2.0-flash-exp',
-            ]
-            
-            available_models = [m.name for m in client.models.list() if 'generateContent' in m.supported_generation_methods]
-            
-            for model_name in model_priority:
-                for available in available_models:
-                    if model_name in available:
-                        self.model = available
-                        self.model_name = available
-                        self.is_working = True
-                        return
-            
-            for m in available_models:
-                if 'flash' in m.lower():
-                    self.model = m
-                    self.model_name = m
-                    self.is_working = True
-                    return
-            
-            if available_models:
-                self.model = available_models[0]
-                self.model_name = available_models[0]
-                self.is_working = True
+            if self._ensure_client() is None:
+                raise RuntimeError("client not available")
+            self._probe()
         except Exception as e:
-            print(f"[!] Google API init failed: {e}")
-            self.is_working = False
-            self.model = None
-    
+            kind = classify_error(e)
+            print(f"[!] {self.name} health check failed ({kind}): {e}")
+            self._record_health(False, kind)
+            return False
+        self._record_health(True)
+        return True
+
+    def check_health(self, background=True):
+        """Probe the API unless a fresh cached result exists.
+
+        With background=True the probe runs in a daemon thread and the
+        current (cached or optimistic) status is returned immediately.
+        """
+        cached = self.cached_health()
+        if cached is not None:
+            return cached and self.is_working
+        if not background:
+            return self._run_probe()
+        key = self._health_key()
+        with _health_lock:
+            thread = _health_threads.get(key)
+            if thread is None or not thread.is_alive():
+                thread = threading.Thread(target=self._run_probe, daemon=True)
+                _health_threads[key] = thread
+                thread.start()
+        return self.is_working
+
     def test_connection(self):
-        """Test if API is working"""
+        """Test if API is working (cached, never touches the network)"""
         return self.is_working
-    
-    def generate(self, prompt):
-        if self.model and self.is_working:
+
+    def resolve_model(self):
+        """Name of the model the next request will use, resolving it first where that is done lazily"""
+        return getattr(self, 'model_name', None)
+
+    def _generate(self, prompt, max_tokens=None, json_schema=None):
+        """Send the prompt to the API and return its text; raise on errors"""
+        raise NotImplementedError
+
+    def _request_tokens(self, prompt, max_tokens):
+        if max_tokens:
+            return estimate_tokens(prompt, max_tokens)
+        return estimate_tokens(prompt)
+
+    def generate(self, prompt, session_id=None, max_tokens=None, json_schema=None):
+        """Generate text, retrying transient and quota errors with jittered backoff.
+
+        max_tokens caps the completion length (None uses the provider default).
+        json_schema switches providers with supports_json_schema to JSON output.
+        Returns None when the circuit is open, the rate-limit queue times
+        out, or the call fails for good.
+        """
+        if not self.is_working or self._ensure_client() is None:
+            return None
+        # The breaker is claimed once and sees one outcome per request, so
+        # retries of one flaky request don't count as several failures
+        attempt = 0
+        while True:
+            if not self.scheduler.acquire(session_id, self._request_tokens(prompt, max_tokens)):
+                print(f"[!] {self.name} rate limit queue timed out")
+                if attempt:
+                    self.breaker.record_failure()
+                return None
+            if attempt == 0 and not self.breaker.allow_request():
+                return None
+            start = time.monotonic()
             try:
-                client = genai.Client(api_key=self.api_key)
-                response = client.models.generate_content(model=self.model, contents=prompt)
-                return response.text
+                result = self._generate(prompt, max_tokens, json_schema)
             except Exception as e:
-                print(f"[!] Google API error: {e}")
-                self.is_working = False
-                return None
-        return None
+                kind = classify_error(e)
+                print(f"[!] {self.name} API error ({kind}): {e}")
+                if kind == AUTH:
+                    self.breaker.trip()
+                    return None
+                if not self.retry_policy.should_retry(kind, attempt):
+                    self.breaker.record_failure()
+                    return None
+                time.sleep(self.retry_policy.delay(kind, attempt))
+                attempt += 1
+                continue
+            self.latency.record(time.monotonic() - start)
+            self._record_health(True)
+            return result
 
+    async def agenerate(self, prompt, session_id=None, max_tokens=None, json_schema=None):
+        """Async version of generate().
 
-class GroqProvider:
-    def __init__(self, api_key):
-        self.api_key = api_key
-        self.client = None
-        self.model_name = "llama-3.3-70b-versatile"
-        self.is_working = False
-        self._init_client()
-    
-    def _init_client(self):
-        try:
-            from groq import Groq
-            self.client = Groq(api_key=self.api_key)
-            # Test connection
-            self.client.chat.completions.create(
-                messages=[{"role": "user", "content": "test"}],
-                model=self.model_name,
-                max_tokens=5
-            )
-            self.is_working = True
-        except ImportError:
-            print("[!] Groq library not installed")
-            self.is_working = False
-        except Exception as e:
-            print(f"[!] Groq init failed: {e}")
-            self.is_working = False
-    
-    def test_connection(self):
-        """Test if API is working"""
-        return self.is_working
-    
-    def generate(self, prompt):
-        if self.client and self.is_working:
+        The blocking call runs on a worker thread so the pooled sync client
+        is reused; SDK async clients are bound to one event loop and would
+        break across Streamlit reruns that each start a new loop.
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.generate, prompt, session_id, max_tokens, json_schema)
+
+    def _generate_stream(self, prompt, max_tokens=None):
+        """Yield text chunks from the API; raise on errors"""
+        raise NotImplementedError
+
+    def generate_stream(self, prompt, session_id=None, max_tokens=None):
+        """Yield text chunks as the model produces them.
+
+        Same rate limiting, retries and circuit breaking as generate(), except
+        that a stream is only retried if it failed before yielding any text.
+        Closing the generator early closes the underlying HTTP stream.
+        """
+        if not self.is_working or self._ensure_client() is None:
+            return
+        attempt = 0
+        while True:
+            if not self.scheduler.acquire(session_id, self._request_tokens(prompt, max_tokens)):
+                print(f"[!] {self.name} rate limit queue timed out")
+                if attempt:
+                    self.breaker.record_failure()
+                return
+            if attempt == 0 and not self.breaker.allow_request():
+                return
+            start = time.monotonic()
+            produced = False
+            stream = self._generate_stream(prompt, max_tokens)
             try:
-                chat_completion = self.client.chat.completions.create(
-                    messages=[
-                        {"role": "system", "content": "You are a helpful Thai education assistant."},
-                        {"role": "user", "content": prompt}
-                    ],
-                    model=self.model_name,
-                    temperature=0.7,
-                )
-                return chat_completion.choices[0].message.content
+                for chunk in stream:
+                    if chunk:
+                        produced = True
+                        yield chunk
+            except GeneratorExit:
+                # Caller stopped reading early; the call itself was fine.
+                # Closing the stream now stops the model generating further tokens.
+                stream.close()
+                self.breaker.record_success()
+                raise
             except Exception as e:
-                print(f"[!] Groq API error: {e}")
-                self.is_working = False
-                return None
-        return None
+                kind = classify_error(e)
+                print(f"[!] {self.name} API stream error ({kind}): {e}")
+                if kind == AUTH:
+                    self.breaker.trip()
+                    return
+                if produced or not self.retry_policy.should_retry(kind, attempt):
+                    self.breaker.record_failure()
+                    return
+                time.sleep(self.retry_policy.delay(kind, attempt))
+                attempt += 1
+                continue
+            self.latency.record(time.monotonic() - start)
+            self._record_health(True)
+            return
 
 
-class OpenRouterProvider:
-    def __init__(self, api_key):
-        self.api_key = api_key
-        self.client = None
-        self.model_name = "openrouter/auto"
-        self.is_working = False
-        self._init_client()
-    
-    def _init_client(self):
+class GoogleProvider(BaseProvider):
+    name = "Google"
+    supports_json_schema = True
+
+    def __init__(self, api_key, pool_size=10, keepalive_expiry=30.0, base_url=None,
+                 selection_policy="priority", **kwargs):
+        self.pool_size = pool_size
+        self.keepalive_expiry = keepalive_expiry
+        self.base_url = base_url
+        # "priority": hard-coded preference list; "latency": fastest model that passes a tiny quality check
+        self.selection_policy = selection_policy
+        self.model = None
+        self.model_name = None
+        self._model_checked_at = 0.0
+        self._benchmark_thread = None
+        super().__init__(api_key, **kwargs)
+
+    def _create_client(self):
+        """Create one long-lived Gemini client with a keep-alive connection pool"""
         try:
-            import openai
-            self.client = openai.OpenAI(
-                api_key=self.api_key,
-                base_url="https://openrouter.ai/api/v1"
+            import httpx
+            limits = httpx.Limits(
+                max_connections=self.pool_size,
+                max_keepalive_connections=self.pool_size,
+                keepalive_expiry=self.keepalive_expiry,
             )
-            # Test connection
-            self.client.chat.completions.create(
-                messages=[{"role": "user", "content": "test"}],
-                model="openrouter/auto",
-                max_tokens=5
+            http_options = types.HttpOptions(
+                base_url=self.base_url,
+                client_args={"limits": limits},
+                async_client_args={"limits": limits},
             )
-            self.is_working = True
-        except ImportError:
-            print("[!] OpenRouter library not installed")
-            self.is_working = False
+            return genai.Client(api_key=self.api_key, http_options=http_options)
+        except (ImportError, TypeError, ValueError) as e:
+            # Older google-genai releases don't accept client_args
+            print(f"[!] Gemini pool settings not supported, using defaults: {e}")
+            return genai.Client(api_key=self.api_key, http_options=types.HttpOptions(base_url=self.base_url))
+
+    def _discover_model(self, force_refresh=False):
+        """Pick a model from the disk-cached model list (lists models only when stale)"""
+        key_id = key_fingerprint(self.api_key)
+        available_models = discover_models(self.client, key_id, force_refresh=force_refresh)
+        model = select_by_priority(available_models)
+        if self.selection_policy == "latency":
+            entry = get_cache_entry(key_id)
+            if entry.get("best_model") in available_models:
+                model = entry["best_model"]
+            if time.time() - entry.get("benchmarked_at", 0) >= BENCHMARK_INTERVAL:
+                self._start_benchmark(available_models)
+        if not model:
+            raise RuntimeError("no model supports generateContent")
+        self.model = model
+        self.model_name = model
+        self._model_checked_at = time.time()
+
+    def _start_benchmark(self, available_models):
+        """Re-evaluate model latency in a background thread"""
+        if self._benchmark_thread and self._benchmark_thread.is_alive():
+            return
+        self._benchmark_thread = threading.Thread(target=self._run_benchmark, args=(available_models,), daemon=True)
+        self._benchmark_thread.start()
+
+    def _run_benchmark(self, available_models):
+        try:
+            best = run_benchmark(self._benchmark_generate, key_fingerprint(self.api_key), available_models)
         except Exception as e:
-            print(f"[!] OpenRouter init failed: {e}")
-            self.is_working = False
-    
-    def test_connection(self):
-        """Test if API is working"""
-        return self.is_working
-    
-    def generate(self, prompt):
-        if self.client and self.is_working:
+            print(f"[!] Gemini model benchmark failed: {e}")
+            return
+        if best:
+            print(f"[OK] Fastest Gemini model: {best}")
+            self.model = best
+            self.model_name = best
+
+    def _benchmark_generate(self, model, prompt):
+        # Benchmark calls share the key's rate limits and circuit breaker with
+        # real requests; a model-specific rejection doesn't count as a failure
+        if not self.scheduler.acquire(BENCHMARK_SESSION, self._request_tokens(prompt, None)):
+            raise RuntimeError("rate limit queue timed out")
+        # Only benchmark a healthy provider; never take a half-open breaker's probe
+        if self.breaker.state != CircuitBreaker.CLOSED:
+            raise RuntimeError("circuit not closed")
+        try:
+            response = self.client.models.generate_content(model=model, contents=prompt)
+        except Exception as e:
+            kind = classify_error(e)
+            if kind == AUTH:
+                self.breaker.trip()
+            elif kind in (TRANSIENT, QUOTA):
+                self.breaker.record_failure()
+            raise
+        return response.text
+
+    def _probe(self):
+        # The disk-cached model list (refreshed daily) is enough to confirm the
+        # key; listing models on every probe would run every HEALTH_CHECK_TTL
+        self._discover_model()
+
+    def resolve_model(self):
+        # Discovery normally waits for the first request; callers keying caches
+        # on the model need the real name before that request is made
+        if self.model is None:
             try:
-                chat_completion = self.client.chat.completions.create(
-                    messages=[
-                        {"role": "system", "content": "You are a helpful Thai education assistant."},
-                        {"role": "user", "content": prompt}
-                    ],
-                    model=self.model_name,
-                    temperature=0.7,
-                )
-                return chat_completion.choices[0].message.content
+                if self._ensure_client() is not None:
+                    self._discover_model()
             except Exception as e:
-                print(f"[!] OpenRouter API error: {e}")
-                self.is_working = False
-                return None
-        return None
+                print(f"[!] Gemini model discovery failed: {e}")
+        return self.model_name
+
+    def _generation_config(self, max_tokens, json_schema=None):
+        options = {}
+        if max_tokens:
+            options["max_output_tokens"] = max_tokens
+        if json_schema:
+            # Constrained decoding: the response is guaranteed to match the schema
+            options["response_mime_type"] = "application/json"
+            options["response_schema"] = json_schema
+        return types.GenerateContentConfig(**options) if options else None
+
+    def _generate(self, prompt, max_tokens=None, json_schema=None):
+        # Model discovery happens on first use, and periodically when selecting by latency
+        if self.model is None or (self.selection_policy == "latency" and
+                                  time.time() - self._model_checked_at >= BENCHMARK_INTERVAL):
+            self._discover_model()
+        response = self.client.models.generate_content(
+            model=self.model, contents=prompt, config=self._generation_config(max_tokens, json_schema))
+        return response.text
+
+    def _generate_stream(self, prompt, max_tokens=None):
+        if self.model is None:
+            self._discover_model()
+        for chunk in self.client.models.generate_content_stream(
+                model=self.model, contents=prompt, config=self._generation_config(max_tokens)):
+            yield chunk.text
 
 
-def create_ai_provider(provider_name, api_key):
-    """Factory function to create AI provider"""
+class GroqProvider(BaseProvider):
+    name = "Groq"
+    supports_json_schema = True
+
+    def __init__(self, api_key, **kwargs):
+        self.model_name = "llama-3.3-70b-versatile"
+        super().__init__(api_key, **kwargs)
+
+    def _library_available(self):
+        return importlib.util.find_spec("groq") is not None
+
+    def _create_client(self):
+        from groq import Groq
+        return Groq(api_key=self.api_key)
+
+    def _probe(self):
+        # Listing models costs no tokens, unlike a test completion
+        self.client.models.list()
+
+    def _generate(self, prompt, max_tokens=None, json_schema=None):
+        chat_completion = self.client.chat.completions.create(
+            **chat_request(self.model_name, prompt, max_tokens, json_schema))
+        return chat_completion.choices[0].message.content
+
+    def _generate_stream(self, prompt, max_tokens=None):
+        stream = self.client.chat.completions.create(
+            stream=True, **chat_request(self.model_name, prompt, max_tokens))
+        try:
+            for chunk in stream:
+                if chunk.choices:
+                    yield chunk.choices[0].delta.content
+        finally:
+            stream.close()
+
+
+class OpenRouterProvider(BaseProvider):
+    name = "OpenRouter"
+    supports_json_schema = True
+
+    def __init__(self, api_key, **kwargs):
+        self.model_name = "openrouter/auto"
+        super().__init__(api_key, **kwargs)
+
+    def _library_available(self):
+        return importlib.util.find_spec("openai") is not None
+
+    def _create_client(self):
+        import openai
+        return openai.OpenAI(
+            api_key=self.api_key,
+            base_url="https://openrouter.ai/api/v1"
+        )
+
+    def _probe(self):
+        self.client.models.list()
+
+    def _generate(self, prompt, max_tokens=None, json_schema=None):
+        chat_completion = self.client.chat.completions.create(
+            **chat_request(self.model_name, prompt, max_tokens, json_schema))
+        return chat_completion.choices[0].message.content
+
+    def _generate_stream(self, prompt, max_tokens=None):
+        stream = self.client.chat.completions.create(
+            stream=True, **chat_request(self.model_name, prompt, max_tokens))
+        try:
+            for chunk in stream:
+                if chunk.choices:
+                    yield chunk.choices[0].delta.content
+        finally:
+            stream.close()
+
+
+def create_ai_provider(provider_name, api_key, **options):
+    """Factory function to create AI provider (options go to the provider class)"""
     providers = {
-        "Google Gemini": lambda: GoogleProvider(api_key),
-        "Groq": lambda: GroqProvider(api_key),
-        "OpenRouter": lambda: OpenRouterProvider(api_key),
+        "Google Gemini": lambda: GoogleProvider(api_key, **options),
+        "Groq": lambda: GroqProvider(api_key, **options),
+        "OpenRouter": lambda: OpenRouterProvider(api_key, **options),
     }
-    
+
     if provider_name in providers:
         try:
             return providers[provider_name]()
@@ -0,0 +1,302 @@
+# document_text.py - Streaming text extraction from uploaded PDF and Word files
+import mmap
+import multiprocessing
+import os
+import re
+import shutil
+import tempfile
+import threading
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from xml.etree.ElementTree import iterparse
+
+from pypdf import PdfReader
+
+from .extraction_cache import file_digest
+from .text_chunks import TextChunk
+
+# Part of the extraction cache key: bump when extracted text would change
+EXTRACTOR_VERSION = 2
+
+# PDF pages are extracted in worker processes (pypdf is pure Python, so
+# threads would not help) once a file has PARALLEL_MIN_PAGES pages; below
+# that, starting the work costs more than it saves.
+PARALLEL_MIN_PAGES = 40
+PDF_MAX_WORKERS = 4
+RANGES_PER_WORKER = 2  # smaller page ranges even out pages that are slower to parse
+SPOOL_BLOCK_SIZE = 1024 * 1024  # uploads are copied to disk (and hashed) this many bytes at a time
+
+# WordprocessingML elements read by the streaming .docx extractor
+_W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+_W_P, _W_T, _W_TAB, _W_BR, _W_CR = _W + "p", _W + "t", _W + "tab", _W + "br", _W + "cr"
+_W_TBL, _W_TR, _W_TC = _W + "tbl", _W + "tr", _W + "tc"
+TABLE_CELL_SEPARATOR = " | "
+
+MAX_PAGE_NUMBER = 100000  # page specs are clamped to this when the page count is unknown
+_PAGE_SPEC = re.compile(r'^\s*(\d+)\s*(?:-\s*(\d*))?\s*$')
+
+_pdf_pools = {}
+_pdf_pools_lock = threading.Lock()
+
+
+def _get_pdf_pool(workers):
+    # Created on first use and shared by all sessions; "spawn" because the
+    # Streamlit server is multi-threaded, which fork does not handle safely
+    with _pdf_pools_lock:
+        if workers not in _pdf_pools:
+            _pdf_pools[workers] = ProcessPoolExecutor(max_workers=workers,
+                                                      mp_context=multiprocessing.get_context("spawn"))
+        return _pdf_pools[workers]
+
+
+def _discard_pdf_pool(workers, pool):
+    # A pool whose worker died (e.g. killed for memory) rejects all later work;
+    # forget it so the next large upload starts a fresh one
+    with _pdf_pools_lock:
+        if _pdf_pools.get(workers) is pool:
+            del _pdf_pools[workers]
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def pdf_workers():
+    """Worker processes used for PDF extraction on this machine (1 means single-process)"""
+    return max(1, min(PDF_MAX_WORKERS, os.cpu_count() or 1))
+
+
+class DocumentChunk(TextChunk):
+    """A page (PDF) or paragraph or table row (Word) of extracted text.
+
+    start is the character offset in the full extracted text, which is the
+    concatenation of all chunk texts; page is 1-based (None for Word files).
+    """
+
+    __slots__ = ("page",)
+
+    def __init__(self, index, start, text, page=None):
+        super().__init__(index, start, text)
+        self.page = page
+
+    def __repr__(self):
+        return f"DocumentChunk({self.index}, start={self.start}, page={self.page}, chars={len(self.text)})"
+
+
+def _file_kind(uploaded_file):
+    name = getattr(uploaded_file, "name", "") or ""
+    return name.lower().rsplit(".", 1)[-1] if "." in name else ""
+
+
+def parse_page_range(spec, page_count=None):
+    """Sorted 1-based page numbers selected by spec, without duplicates.
+
+    spec is a string such as "3-7, 10, 15-" (an open range runs to the last
+    page), an int, or an iterable of ints. Pages past page_count (or past
+    MAX_PAGE_NUMBER when it is unknown) are dropped before ranges are
+    expanded, so a huge range costs no more than the document's length.
+    None or "" selects nothing here; callers treat that as "all pages".
+    Raises ValueError on malformed specs.
+    """
+    if spec is None or spec == "":
+        return []
+    limit = MAX_PAGE_NUMBER if page_count is None else min(page_count, MAX_PAGE_NUMBER)
+    if isinstance(spec, int):
+        spec = [spec]
+    ranges = []
+    if isinstance(spec, str):
+        for part in spec.split(","):
+            if not part.strip():
+                continue
+            match = _PAGE_SPEC.match(part)
+            if not match:
+                raise ValueError(f"invalid page range: {part.strip()!r}")
+            first = int(match.group(1))
+            if match.group(2) is None:
+                last = first
+            elif match.group(2):
+                last = int(match.group(2))
+            elif page_count is None:
+                raise ValueError(f"open page range needs the page count: {part.strip()!r}")
+            else:
+                last = page_count
+            ranges.append((first, last))
+    else:
+        ranges = [(number, number) for number in spec]
+
+    selected = set()
+    for first, last in ranges:
+        if first < 1:
+            raise ValueError(f"page numbers start at 1: {first}")
+        if first <= limit:
+            selected.update(range(first, min(last, limit) + 1))
+    return sorted(selected)
+
+
+@contextmanager
+def _spooled_pdf(uploaded_file):
+    # Copy the upload to a temporary file in blocks and memory-map it: pypdf
+    # then reads from page-cache-backed memory the kernel can share and drop,
+    # and worker processes open the same file instead of receiving a copy.
+    fd, path = tempfile.mkstemp(suffix=".pdf")
+    try:
+        with os.fdopen(fd, "wb") as spool:
+            uploaded_file.seek(0)
+            shutil.copyfileobj(uploaded_file, spool, SPOOL_BLOCK_SIZE)
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            yield path, mapped
+    finally:
+        uploaded_file.seek(0)
+        os.remove(path)
+
+
+def _extract_pages(path, numbers):
+    # Runs in a worker process: map the spooled PDF, extract the given 1-based pages
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        reader = PdfReader(mapped)
+        return [reader.pages[number - 1].extract_text() or "" for number in numbers]
+
+
+def _page_batches(numbers, parts):
+    size = -(-len(numbers) // parts)
+    return [numbers[i:i + size] for i in range(0, len(numbers), size)]
+
+
+def _pdf_pieces(uploaded_file, workers=None, pages=None):
+    with _spooled_pdf(uploaded_file) as (path, mapped):
+        reader = PdfReader(mapped)
+        page_count = len(reader.pages)
+        # Only the selected pages are ever decoded
+        numbers = parse_page_range(pages, page_count) if pages else list(range(1, page_count + 1))
+        workers = pdf_workers() if workers is None else workers
+        if workers > 1 and len(numbers) >= PARALLEL_MIN_PAGES:
+            done = 0
+            for piece in _parallel_pdf_pieces(path, numbers, workers):
+                yield piece
+                done += 1
+            numbers = numbers[done:]  # left over if the worker pool broke
+        for number in numbers:
+            yield number, reader.pages[number - 1].extract_text() or ""
+
+
+def _parallel_pdf_pieces(path, numbers, workers):
+    # Yields the pages in order; stops early (without raising) if the pool is broken
+    batches = _page_batches(numbers, workers * RANGES_PER_WORKER)
+    pool = _get_pdf_pool(workers)
+    try:
+        # map() returns results in submission order, so pages stay in order
+        # and the first batch is yielded while later ones are still running
+        results = pool.map(_extract_pages, [path] * len(batches), batches)
+        try:
+            for batch, texts in zip(batches, results):
+                yield from zip(batch, texts)
+        finally:
+            results.close()  # a consumer that stops early cancels the batches not yet started
+    except BrokenProcessPool as e:
+        print(f"[!] PDF worker pool failed ({e}); extracting the rest in-process")
+        _discard_pdf_pool(workers, pool)
+
+
+def _docx_pieces(uploaded_file):
+    # Stream word/document.xml straight from the zip instead of building
+    # python-docx's object model, so memory stays proportional to one
+    # paragraph or table row. Body paragraphs are yielded as they end; a
+    # table row is yielded as one piece, its cells joined by
+    # TABLE_CELL_SEPARATOR (nested tables are flattened into their cell).
+    uploaded_file.seek(0)
+    with zipfile.ZipFile(uploaded_file) as archive, archive.open("word/document.xml") as xml:
+        paragraphs = []   # text runs of each open paragraph (text boxes nest paragraphs)
+        table_depth = 0
+        row = cell = None
+        for event, elem in iterparse(xml, events=("start", "end")):
+            tag = elem.tag
+            if event == "start":
+                if tag == _W_P:
+                    paragraphs.append([])
+                elif tag == _W_TBL:
+                    table_depth += 1
+                elif table_depth == 1 and tag == _W_TR:
+                    row = []
+                elif table_depth == 1 and tag == _W_TC:
+                    cell = []
+                continue
+
+            if tag == _W_T:
+                if paragraphs and elem.text:
+                    paragraphs[-1].append(elem.text)
+            elif tag == _W_TAB:
+                if paragraphs:
+                    paragraphs[-1].append("\t")
+            elif tag == _W_BR or tag == _W_CR:
+                if paragraphs:
+                    paragraphs[-1].append("\n")
+            elif tag == _W_P:
+                text = "".join(paragraphs.pop())
+                if table_depth:
+                    if text:
+                        cell.append(text)
+                else:
+                    yield None, text
+                    elem.clear()
+            elif tag == _W_TBL:
+                table_depth -= 1
+                if not table_depth:
+                    elem.clear()
+            elif table_depth == 1 and tag == _W_TC:
+                row.append(" ".join(cell))
+                cell = None
+            elif table_depth == 1 and tag == _W_TR:
+                if any(row):
+                    yield None, TABLE_CELL_SEPARATOR.join(row)
+                row = None
+                elem.clear()
+
+
+def iter_document_text(uploaded_file, workers=None, cache=None, pages=None):
+    """Yield DocumentChunks of a PDF or .docx file as they are extracted.
+
+    Each chunk's text ends with a newline. PDFs are spooled to a temporary
+    file and memory-mapped rather than parsed from memory; `pages` (see
+    parse_page_range, e.g. "3-7, 10") limits extraction to those pages, and
+    is ignored for Word files. Large PDFs are split into page batches
+    extracted by up to `workers` processes (default: pdf_workers()), and
+    pages are still yielded in order. With an ExtractionCache, a file whose
+    bytes were extracted before is replayed without parsing it, and a fully
+    read new file is stored. Nothing is yielded for other file types; parse
+    errors propagate to the caller.
+    """
+    kind = _file_kind(uploaded_file)
+    if kind not in ("pdf", "docx"):
+        return
+    if kind != "pdf":
+        pages = None
+    key = collected = None
+    pieces = None
+    if cache is not None:
+        key = f"{kind}-v{EXTRACTOR_VERSION}:{file_digest(uploaded_file)}"
+        pieces = cache.get(key)
+        if pieces is not None and pages:
+            selected = set(parse_page_range(pages, len(pieces)))
+            pieces = [piece for piece in pieces if piece[0] in selected]
+        elif pieces is None and not pages:
+            collected = []  # a page selection is never cached as the whole document
+    if pieces is None:
+        pieces = _pdf_pieces(uploaded_file, workers, pages) if kind == "pdf" else _docx_pieces(uploaded_file)
+
+    offset = 0
+    for index, (page, text) in enumerate(pieces):
+        if collected is not None:
+            collected.append((page, text))
+        text += "\n"
+        yield DocumentChunk(index, offset, text, page)
+        offset += len(text)
+    # Only documents read to the end are cached
+    if collected is not None:
+        cache.put(key, collected)
+
+
+def extract_document_text(uploaded_file, workers=None, cache=None, pages=None):
+    """Full text of a PDF or .docx file (or the selected PDF pages), or an "Error extracting text: ..." message"""
+    try:
+        return "".join(chunk.text for chunk in iter_document_text(uploaded_file, workers, cache, pages))
+    except Exception as e:
+        return f"Error extracting text: {e}"
@@ -132,3 +132,29 @@ class DocxExporter:
         doc.save(buffer)
         buffer.seek(0)
         return buffer
+    
+    def create_summary_doc(self, title, school_name, topic, summary):
+        """Create a Word document with a content summary"""
+        doc = Document()
+        
+        heading = doc.add_heading(title, 0)
+        heading.alignment = WD_ALIGN_PARAGRAPH.CENTER
+        
+        if school_name:
+            school_para = doc.add_paragraph(school_name)
+            school_para.alignment = WD_ALIGN_PARAGRAPH.CENTER
+        
+        topic_para = doc.add_paragraph(f"หัวข้อ: {topic}")
+        topic_para.alignment = WD_ALIGN_PARAGRAPH.CENTER
+        
+        doc.add_heading("สรุปเนื้อหา / Summary", level=1)
+        
+        # One Word paragraph per line of the summary
+        for paragraph in (summary or "").split("\n"):
+            if paragraph.strip():
+                doc.add_paragraph(paragraph.strip())
+        
+        buffer = io.BytesIO()
+        doc.save(buffer)
+        buffer.seek(0)
+        return buffer
@@ -4,11 +4,12 @@ from reportlab.lib.pagesizes import A4
 from reportlab.pdfgen import canvas
 from reportlab.lib.units import cm
 from reportlab.lib.colors import black, lightgrey, blue
-from reportlab.lib.utils import ImageReader
+from reportlab.lib.utils import ImageReader, simpleSplit
 from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfbase.ttfonts import TTFont
 import qrcode
 import os
+import unicodedata
 
 # Register Thai font
 FONT_DIR = os.path.dirname(__file__)
@@ -21,6 +22,31 @@ if os.path.exists(THAI_FONT_PATH):
 else:
     DEFAULT_FONT = 'Helvetica'
 
+def _wrap_text(text, font_name, font_size, max_width):
+    """Split text into lines no wider than max_width.
+
+    Lines are broken at spaces where possible; Thai is written without
+    spaces between words, so a run still too wide is broken between
+    characters (never before a combining vowel or tone mark).
+    """
+    lines = []
+    for line in simpleSplit(text, font_name, font_size, max_width):
+        while pdfmetrics.stringWidth(line, font_name, font_size) > max_width:
+            cut, used = 0, 0.0
+            for char in line:
+                used += pdfmetrics.stringWidth(char, font_name, font_size)
+                if used > max_width:
+                    break
+                cut += 1
+            cut = max(cut, 1)
+            while 1 < cut < len(line) and unicodedata.category(line[cut]).startswith("M"):
+                cut -= 1
+            lines.append(line[:cut])
+            line = line[cut:]
+        lines.append(line)
+    return lines
+
+
 class PDFExporter:
     """Export worksheets to PDF format"""
     
@@ -174,3 +200,62 @@ class PDFExporter:
         c.save()
         buffer.seek(0)
         return buffer
+    
+    def create_summary_pdf(self, title, school_name, topic, summary, qr_url=None, uploaded_logo=None):
+        """Create a PDF with a content summary, wrapping paragraphs to the page width"""
+        buffer = io.BytesIO()
+        c = canvas.Canvas(buffer, pagesize=A4)
+        width, height = A4
+        
+        left_margin = 1.5 * cm
+        right_margin = width - 1.5 * cm
+        top_margin = height - 2 * cm
+        bottom_margin = 2 * cm
+        
+        if school_name:
+            c.setFont("Helvetica-Bold", 12)
+            c.drawString(left_margin, top_margin, school_name)
+        
+        c.setFont("Helvetica-Bold", 16)
+        c.drawCentredString(width / 2, top_margin - 1 * cm, title)
+        c.setFont(self.font_name, 12)
+        c.drawCentredString(width / 2, top_margin - 1.8 * cm, f"หัวข้อ: {topic}")
+        c.line(left_margin, top_margin - 2.3 * cm, right_margin, top_margin - 2.3 * cm)
+        
+        # Summary text, wrapped line by line; Thai needs the Thai font to render
+        font_size = 12
+        line_height = 0.6 * cm
+        y_position = top_margin - 3 * cm
+        c.setFont(self.font_name, font_size)
+        for paragraph in (summary or "").split("\n"):
+            paragraph = paragraph.strip()
+            lines = _wrap_text(paragraph, self.font_name, font_size, right_margin - left_margin) if paragraph else [""]
+            for line in lines:
+                if y_position < bottom_margin:
+                    c.showPage()
+                    c.setFont(self.font_name, font_size)
+                    y_position = top_margin
+                c.drawString(left_margin, y_position, line)
+                y_position -= line_height
+        
+        if qr_url:
+            qr = qrcode.QRCode(box_size=10, border=1)
+            qr.add_data(qr_url)
+            qr.make(fit=True)
+            qr_img = qr.make_image(fill_color="black", back_color="white")
+            
+            qr_buffer = io.BytesIO()
+            qr_img.save(qr_buffer)
+            qr_buffer.seek(0)
+            
+            qr_size = 3 * cm
+            if y_position - qr_size < bottom_margin:
+                c.showPage()
+            c.drawImage(ImageReader(qr_buffer), right_margin - qr_size, bottom_margin + 1 * cm, width=qr_size, height=qr_size)
+        
+        c.setFont(self.font_name, 8)
+        c.drawCentredString(width / 2, 0.7 * cm, f"สร้างโดย EasyWorksheet Pro Max")
+        
+        c.save()
+        buffer.seek(0)
+        return buffer
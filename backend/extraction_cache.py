@@ -0,0 +1,123 @@
+# extraction_cache.py - Persistent SQLite cache of text extracted from uploaded files (LRU by size)
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".easyworksheet", "extracted_text.sqlite3")
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024  # least recently used documents are evicted past this much text
+
+
+def file_digest(fileobj, block_size=1024 * 1024):
+    """SHA-256 of a binary file object's bytes, read in blocks from the start; the file is rewound"""
+    digest = hashlib.sha256()
+    fileobj.seek(0)
+    for block in iter(lambda: fileobj.read(block_size), b""):
+        digest.update(block)
+    fileobj.seek(0)
+    return digest.hexdigest()
+
+
+class ExtractionCache:
+    """SQLite-backed cache of extracted document text, keyed by the file's content hash.
+
+    Each entry is the document's list of (page, text) pieces, so a cached
+    file replays the same page-wise chunks as a fresh extraction.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_bytes=DEFAULT_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        # One connection shared across threads, serialized by self._lock
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("""CREATE TABLE IF NOT EXISTS documents (
+                key TEXT PRIMARY KEY,
+                pieces TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )""")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_documents_last_access ON documents (last_access)")
+
+    def get(self, key):
+        """Return the cached [(page, text), ...] for key, or None"""
+        try:
+            with self._lock, self._conn:
+                row = self._conn.execute("SELECT pieces FROM documents WHERE key = ?", (key,)).fetchone()
+                if row:
+                    self._conn.execute("UPDATE documents SET last_access = ? WHERE key = ?", (time.time(), key))
+                    self.hits += 1
+                    return [tuple(piece) for piece in json.loads(row[0])]
+        except (sqlite3.Error, ValueError) as e:
+            print(f"[!] Extraction cache read failed: {e}")
+        self.misses += 1
+        return None
+
+    def put(self, key, pieces):
+        """Store a document's pieces, then evict least recently used documents past max_bytes"""
+        payload = json.dumps(pieces, ensure_ascii=False)
+        size = len(payload.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        now = time.time()
+        try:
+            with self._lock, self._conn:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO documents (key, pieces, size, created_at, last_access) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (key, payload, size, now, now),
+                )
+                # Keep the most recently used documents whose sizes add up to max_bytes
+                self._conn.execute(
+                    "DELETE FROM documents WHERE key IN ("
+                    "SELECT key FROM (SELECT key, SUM(size) OVER (ORDER BY last_access DESC, key) AS total "
+                    "FROM documents) WHERE total > ?)",
+                    (self.max_bytes,),
+                )
+        except sqlite3.Error as e:
+            print(f"[!] Extraction cache write failed: {e}")
+
+    def clear(self):
+        """Remove every cached document and reset counters"""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM documents")
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        """Return hit/miss counters, the number of documents and their total size"""
+        with self._lock:
+            entries, size = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM documents").fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": entries,
+            "bytes": size,
+        }
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_extraction_cache():
+    """Return the process-wide extraction cache, or None if it can't be opened"""
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            try:
+                _default_cache = ExtractionCache()
+            except (OSError, sqlite3.Error) as e:
+                print(f"[!] Extraction cache disabled: {e}")
+                _default_cache = False
+        return _default_cache or None
@@ -0,0 +1,54 @@
+# latency.py - Latency histograms for AI provider calls
+import math
+import threading
+from collections import deque
+
+# Upper bounds (seconds) of the histogram buckets
+LATENCY_BUCKETS = (0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 16.0, 32.0, 64.0, math.inf)
+
+
+class LatencyHistogram:
+    """Bucketed latency counts plus a window of recent samples for percentiles"""
+
+    def __init__(self, window=200):
+        self.counts = [0] * len(LATENCY_BUCKETS)
+        self.count = 0
+        self.total = 0.0
+        self.recent = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        with self._lock:
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if seconds <= bound:
+                    self.counts[i] += 1
+                    break
+            self.count += 1
+            self.total += seconds
+            self.recent.append(seconds)
+
+    def percentile(self, pct):
+        """Percentile (0-100) of recent samples, or None without data"""
+        with self._lock:
+            samples = sorted(self.recent)
+        if not samples:
+            return None
+        index = min(len(samples) - 1, max(0, math.ceil(pct / 100 * len(samples)) - 1))
+        return samples[index]
+
+    def snapshot(self):
+        """Counts per bucket and the usual percentiles, for tuning and display"""
+        with self._lock:
+            buckets = {
+                (f"<= {bound:g}s" if bound != math.inf else f"> {LATENCY_BUCKETS[-2]:g}s"): n
+                for bound, n in zip(LATENCY_BUCKETS, self.counts)
+            }
+            count, total = self.count, self.total
+        return {
+            "count": count,
+            "mean": total / count if count else None,
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+            "p99": self.percentile(99),
+            "buckets": buckets,
+        }
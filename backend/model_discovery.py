@@ -0,0 +1,135 @@
+# model_discovery.py - Disk-cached Gemini model discovery and latency-based model selection
+import json
+import os
+import threading
+import time
+
+DISCOVERY_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".easyworksheet", "gemini_models.json")
+DISCOVERY_TTL = 24 * 3600        # seconds a cached model list stays valid
+BENCHMARK_INTERVAL = 6 * 3600    # seconds between latency re-evaluations
+BENCHMARK_MAX_CANDIDATES = 4     # keep the benchmark cheap
+
+MODEL_PRIORITY = [
+    'gemini-1.5-flash',
+    'gemini-1.5-pro',
+    'gemini-2.0-flash-exp',
+]
+
+# Tiny prompt with a checkable answer: a model must get it right to be eligible
+BENCHMARK_PROMPT = "ตอบเป็นตัวเลขเท่านั้น: 7 + 5 เท่ากับเท่าไร"
+BENCHMARK_EXPECTED = "12"
+
+_cache_lock = threading.Lock()
+
+
+def _load_cache(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_cache(path, data):
+    try:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"[!] Could not save Gemini model cache: {e}")
+
+
+def _update_entry(key_id, path, **fields):
+    with _cache_lock:
+        data = _load_cache(path)
+        data.setdefault(key_id, {}).update(fields)
+        _save_cache(path, data)
+
+
+def get_cache_entry(key_id, path=DISCOVERY_CACHE_PATH):
+    """Cached discovery/benchmark data for one API key fingerprint"""
+    with _cache_lock:
+        return _load_cache(path).get(key_id, {})
+
+
+def supports_generate(model):
+    # Newer google-genai releases expose supported_actions instead
+    methods = getattr(model, 'supported_actions', None) or getattr(model, 'supported_generation_methods', None) or []
+    return 'generateContent' in methods
+
+
+def list_models(client):
+    """Names of models that support generateContent (network call)"""
+    return [m.name for m in client.models.list() if supports_generate(m)]
+
+
+def discover_models(client, key_id, ttl=DISCOVERY_TTL, force_refresh=False, path=DISCOVERY_CACHE_PATH):
+    """Model list from the disk cache, listing from the API only when stale"""
+    entry = get_cache_entry(key_id, path)
+    if not force_refresh and entry.get("models") and time.time() - entry.get("fetched_at", 0) < ttl:
+        return entry["models"]
+    models = list_models(client)
+    _update_entry(key_id, path, models=models, fetched_at=time.time())
+    return models
+
+
+def select_by_priority(available_models):
+    """Hard-coded preference order, then any flash model, then the first one"""
+    for model_name in MODEL_PRIORITY:
+        for available in available_models:
+            if model_name in available:
+                return available
+
+    for m in available_models:
+        if 'flash' in m.lower():
+            return m
+
+    if available_models:
+        return available_models[0]
+    return None
+
+
+def benchmark_candidates(available_models):
+    """Models worth timing: priority matches first, then other flash models"""
+    candidates = []
+    for model_name in MODEL_PRIORITY:
+        candidates.extend(m for m in available_models if model_name in m and m not in candidates)
+    candidates.extend(m for m in available_models if 'flash' in m.lower() and m not in candidates)
+    return candidates[:BENCHMARK_MAX_CANDIDATES]
+
+
+def benchmark_models(generate, candidates, prompt=BENCHMARK_PROMPT, expected=BENCHMARK_EXPECTED):
+    """Time one tiny request per model; models that fail or answer wrongly get None.
+
+    generate(model, prompt) returns the response text; the provider passes
+    one that goes through its rate-limit scheduler and circuit breaker.
+    """
+    results = {}
+    for model in candidates:
+        start = time.monotonic()
+        try:
+            text = generate(model, prompt) or ""
+        except Exception as e:
+            print(f"[!] Benchmark of {model} failed: {e}")
+            results[model] = None
+            continue
+        results[model] = time.monotonic() - start if expected in text else None
+    return results
+
+
+def fastest_model(results):
+    """Lowest-latency model that passed the quality check, or None"""
+    passed = {model: latency for model, latency in results.items() if latency is not None}
+    if not passed:
+        return None
+    return min(passed, key=passed.get)
+
+
+def run_benchmark(generate, key_id, available_models, path=DISCOVERY_CACHE_PATH):
+    """Benchmark the candidates with generate(model, prompt), store the results on disk and return the winner"""
+    results = benchmark_models(generate, benchmark_candidates(available_models))
+    best = fastest_model(results)
+    _update_entry(key_id, path, benchmark=results, best_model=best, benchmarked_at=time.time())
+    return best
@@ -0,0 +1,95 @@
+# passage_index.py - Offline BM25 ranking of document passages for prompt context
+import math
+import re
+from collections import Counter
+
+from .text_chunks import chunk_text
+
+DEFAULT_PASSAGE_TOKENS = 250
+AUTO_QUERY_TERMS = 30  # distinctive document terms used when no query is given
+
+# Thai is written without spaces between words, so Thai runs are indexed as
+# overlapping character bigrams; other scripts are indexed as lowercase words.
+_TERM = re.compile(r'[฀-๿]+|[^\W฀-๿]+')
+_THAI = re.compile(r'[฀-๿]')
+
+
+def tokenize(text):
+    """Index terms of text: words, and character bigrams of Thai runs"""
+    terms = []
+    for run in _TERM.findall((text or "").lower()):
+        if _THAI.match(run):
+            if len(run) == 1:
+                terms.append(run)
+            else:
+                terms.extend(run[i:i + 2] for i in range(len(run) - 1))
+        elif len(run) > 1 or run.isdigit():
+            terms.append(run)
+    return terms
+
+
+class BM25Index:
+    """Okapi BM25 over a list of passages (strings), built in memory"""
+
+    def __init__(self, passages, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.term_counts = [Counter(tokenize(p)) for p in passages]
+        self.lengths = [sum(counts.values()) for counts in self.term_counts]
+        self.avg_length = (sum(self.lengths) / len(self.lengths)) if self.lengths else 0
+        doc_freq = Counter()
+        for counts in self.term_counts:
+            doc_freq.update(counts.keys())
+        n = len(passages)
+        self.idf = {term: math.log(1 + (n - df + 0.5) / (df + 0.5)) for term, df in doc_freq.items()}
+
+    def scores(self, query):
+        """BM25 score of every passage for query (a string or a list of terms)"""
+        terms = tokenize(query) if isinstance(query, str) else query
+        weights = Counter(term for term in terms if term in self.idf)
+        scores = []
+        for counts, length in zip(self.term_counts, self.lengths):
+            norm = self.k1 * (1 - self.b + self.b * length / (self.avg_length or 1))
+            score = 0.0
+            for term, qf in weights.items():
+                tf = counts.get(term)
+                if tf:
+                    score += qf * self.idf[term] * tf * (self.k1 + 1) / (tf + norm)
+            scores.append(score)
+        return scores
+
+    def key_terms(self, limit=AUTO_QUERY_TERMS):
+        """Terms that characterise the whole document: frequent overall, but not in every passage"""
+        totals = Counter()
+        for counts in self.term_counts:
+            totals.update(counts)
+        ranked = sorted(totals, key=lambda term: totals[term] * self.idf[term], reverse=True)
+        return ranked[:limit]
+
+
+def select_passages(text, query=None, budget_tokens=6000, passage_tokens=DEFAULT_PASSAGE_TOKENS):
+    """The passages of text most relevant to query that fit in budget_tokens.
+
+    Returns TextChunks in document order; passages that match nothing are
+    left out. Without a query (or when nothing in the text matches it),
+    passages are ranked against the document's own key terms, which favours
+    its most informative parts.
+    """
+    passages = chunk_text(text, passage_tokens)
+    if sum(p.tokens for p in passages) <= budget_tokens:
+        return passages
+
+    index = BM25Index([p.text for p in passages])
+    scores = index.scores(query) if query else []
+    if not any(scores):
+        scores = index.scores(index.key_terms())
+
+    selected = []
+    used = 0
+    for i in sorted(range(len(passages)), key=lambda i: scores[i], reverse=True):
+        tokens = passages[i].tokens
+        if scores[i] > 0 and used + tokens <= budget_tokens:
+            selected.append(passages[i])
+            used += tokens
+    selected.sort(key=lambda p: p.index)
+    return selected
@@ -0,0 +1,176 @@
+# provider_chain.py - Ordered failover across AI providers with rolling health scores
+import asyncio
+import threading
+import time
+import weakref
+from collections import deque
+
+from .latency import LatencyHistogram
+
+HEALTH_WINDOW = 50          # most recent outcomes kept per provider
+MIN_SAMPLES = 5             # outcomes needed before a provider can be demoted
+MIN_SUCCESS_RATE = 0.5      # below this a provider is tried after healthy ones
+SLOW_LATENCY = 30.0         # seconds; a slower median also demotes a provider
+
+
+class ProviderHealth:
+    """Rolling success rate and latency of one provider"""
+
+    def __init__(self, window=HEALTH_WINDOW):
+        self.outcomes = deque(maxlen=window)  # (success, seconds)
+        self._lock = threading.Lock()
+
+    def record(self, success, seconds):
+        with self._lock:
+            self.outcomes.append((success, seconds))
+
+    def success_rate(self):
+        with self._lock:
+            if not self.outcomes:
+                return 1.0
+            return sum(1 for success, _ in self.outcomes if success) / len(self.outcomes)
+
+    def median_latency(self):
+        with self._lock:
+            latencies = sorted(seconds for success, seconds in self.outcomes if success)
+        if not latencies:
+            return None
+        return latencies[len(latencies) // 2]
+
+    def is_healthy(self):
+        with self._lock:
+            samples = len(self.outcomes)
+        if samples < MIN_SAMPLES:
+            return True
+        median = self.median_latency()
+        return self.success_rate() >= MIN_SUCCESS_RATE and (median is None or median <= SLOW_LATENCY)
+
+    def score(self):
+        """Higher is better: success rate discounted by median latency"""
+        median = self.median_latency() or 0.0
+        return self.success_rate() / (1.0 + median / SLOW_LATENCY)
+
+
+# Health is tracked per shared provider object, so every session's chain
+# learns from the outcomes of all the others
+_health = weakref.WeakKeyDictionary()
+_health_lock = threading.Lock()
+
+
+def get_provider_health(provider):
+    """Return the rolling health record for a provider object"""
+    with _health_lock:
+        health = _health.get(provider)
+        if health is None:
+            health = _health[provider] = ProviderHealth()
+        return health
+
+
+class ProviderChain:
+    """Tries providers in configured order (e.g. Groq -> Gemini -> OpenRouter).
+
+    Healthy providers keep their configured order; providers whose rolling
+    success rate or latency is poor are moved behind them, best score first.
+    Behaves like a single provider so WorksheetGenerator can use it as self.ai.
+    """
+    name = "Chain"
+
+    def __init__(self, providers):
+        self.providers = [(name, provider) for name, provider in providers if provider]
+        self.latency = LatencyHistogram()
+        self.last_provider = None
+
+    def route(self):
+        """Providers in the order they should be tried"""
+        healthy, degraded = [], []
+        for name, provider in self.providers:
+            (healthy if get_provider_health(provider).is_healthy() else degraded).append((name, provider))
+        degraded.sort(key=lambda item: get_provider_health(item[1]).score(), reverse=True)
+        return healthy + degraded
+
+    @property
+    def model_name(self):
+        for _, provider in self.route():
+            if provider.is_working:
+                return getattr(provider, 'model_name', None)
+        return None
+
+    def resolve_model(self):
+        """Model of the provider the next request would be routed to"""
+        for _, provider in self.route():
+            if provider.is_working:
+                return provider.resolve_model()
+        return None
+
+    @property
+    def is_working(self):
+        return any(provider.is_working for _, provider in self.providers)
+
+    def test_connection(self):
+        return self.is_working
+
+    def check_health(self, background=True):
+        results = [provider.check_health(background=background) for _, provider in self.providers]
+        return any(results)
+
+    @property
+    def supports_json_schema(self):
+        # Any provider may end up answering, so all of them must honour JSON mode
+        return all(getattr(provider, 'supports_json_schema', False) for _, provider in self.providers)
+
+    def generate(self, prompt, session_id=None, max_tokens=None, json_schema=None):
+        """Return the first successful answer along the routed chain"""
+        start = time.monotonic()
+        for name, provider in self.route():
+            if not provider.is_working:
+                continue
+            call_start = time.monotonic()
+            result = provider.generate(prompt, session_id=session_id, max_tokens=max_tokens, json_schema=json_schema)
+            get_provider_health(provider).record(bool(result), time.monotonic() - call_start)
+            if result:
+                if name != self.providers[0][0]:
+                    print(f"[INFO] Answered by fallback provider {name}")
+                self.last_provider = name
+                self.latency.record(time.monotonic() - start)
+                return result
+        return None
+
+    async def agenerate(self, prompt, session_id=None, max_tokens=None, json_schema=None):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.generate, prompt, session_id, max_tokens, json_schema)
+
+    def generate_stream(self, prompt, session_id=None, max_tokens=None):
+        """Stream from the first provider along the routed chain that produces text"""
+        for name, provider in self.route():
+            if not provider.is_working or not hasattr(provider, 'generate_stream'):
+                continue
+            call_start = time.monotonic()
+            produced = False
+            stream = provider.generate_stream(prompt, session_id=session_id, max_tokens=max_tokens)
+            try:
+                for chunk in stream:
+                    produced = True
+                    yield chunk
+            except GeneratorExit:
+                stream.close()
+                get_provider_health(provider).record(True, time.monotonic() - call_start)
+                self.last_provider = name
+                raise
+            get_provider_health(provider).record(produced, time.monotonic() - call_start)
+            if produced:
+                self.last_provider = name
+                return
+
+    def stats(self):
+        """Rolling health of every provider in the chain, in routing order"""
+        stats = []
+        for name, provider in self.route():
+            health = get_provider_health(provider)
+            stats.append({
+                "provider": name,
+                "working": provider.is_working,
+                "healthy": health.is_healthy(),
+                "success_rate": health.success_rate(),
+                "median_latency": health.median_latency(),
+            })
+        return stats
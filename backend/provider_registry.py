@@ -0,0 +1,79 @@
+# provider_registry.py - Process-wide registry of shared AI provider instances
+import threading
+import time
+
+from .ai_providers import create_ai_provider, key_fingerprint
+
+# Providers unused for this many seconds are dropped from the registry
+PROVIDER_IDLE_TIMEOUT = 1800
+
+
+class ProviderRegistry:
+    """Hands out one shared provider per (provider name, API key fingerprint, options)
+
+    Every Streamlit session that uses the same key and options gets the same
+    provider object, so warm clients and model discovery results are reused.
+    """
+
+    def __init__(self, idle_timeout=PROVIDER_IDLE_TIMEOUT):
+        self.idle_timeout = idle_timeout
+        self._providers = {}  # key -> [provider, last_used]
+        self._lock = threading.Lock()
+
+    def get(self, provider_name, api_key, **options):
+        """Return the shared provider for this key, creating it if needed.
+
+        options go to the provider class (e.g. pool_size and keepalive_expiry
+        for Gemini); a different set of options gets its own provider.
+        """
+        if not api_key:
+            return None
+        key = (provider_name, key_fingerprint(api_key), tuple(sorted(options.items())))
+        now = time.time()
+        with self._lock:
+            self._evict_idle(now)
+            entry = self._providers.get(key)
+            if entry:
+                entry[1] = now
+                return entry[0]
+            # Construction is cheap (no network) so it is safe under the lock
+            provider = create_ai_provider(provider_name, api_key, **options)
+            if provider:
+                self._providers[key] = [provider, now]
+            return provider
+
+    def _evict_idle(self, now):
+        # Evicted providers are only dropped, never closed: a session's
+        # WorksheetGenerator may still hold one and keep using its client,
+        # which is released when the last reference goes away
+        expired = [key for key, (_, last_used) in self._providers.items()
+                   if now - last_used > self.idle_timeout]
+        for key in expired:
+            del self._providers[key]
+
+    def evict_idle(self):
+        """Drop providers that have been idle longer than idle_timeout"""
+        with self._lock:
+            self._evict_idle(time.time())
+
+    def clear(self):
+        """Drop every shared provider (sessions holding one keep it working)"""
+        with self._lock:
+            self._providers.clear()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._providers)
+
+
+_registry = ProviderRegistry()
+
+
+def get_provider_registry():
+    """Return the process-wide provider registry"""
+    return _registry
+
+
+def get_shared_provider(provider_name, api_key, **options):
+    """Return a shared provider instance for this provider name, key and options"""
+    return _registry.get(provider_name, api_key, **options)
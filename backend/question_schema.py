@@ -0,0 +1,135 @@
+# question_schema.py - JSON output schema and validating decoder for AI-generated questions
+import json
+import re
+
+# Response schema sent to providers that support structured output.
+# Kept to the OpenAPI subset Gemini accepts (no $ref, no additionalProperties).
+QUESTION_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "questions": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "question": {"type": "string"},
+                    "answer": {"type": "string"},
+                    "choices": {"type": "array", "items": {"type": "string"}},
+                },
+                "required": ["question", "answer"],
+            },
+        },
+    },
+    "required": ["questions"],
+}
+
+_QUESTIONS_ARRAY = re.compile(r'"questions"\s*:\s*\[')
+_ITEM_SEPARATOR = re.compile(r'[\s,]*')
+
+CHOICE_LABELS = "ABCDEFGH"
+THAI_CHOICE_LABELS = "กขคงจฉชซ"
+
+
+class SchemaError(ValueError):
+    """The AI response is not JSON matching QUESTION_SCHEMA"""
+
+
+class Question:
+    """One generated question with its answer and optional multiple-choice options"""
+
+    __slots__ = ("question", "answer", "choices", "labels")
+
+    def __init__(self, question, answer, choices=None, labels=CHOICE_LABELS):
+        self.question = question
+        self.answer = answer
+        self.choices = choices or []
+        # Option labels, so an answer like "ข" still matches the printed choices
+        self.labels = labels
+
+    @property
+    def text(self):
+        """Question text as printed on the worksheet, with labelled choices"""
+        if not self.choices:
+            return self.question
+        options = "  ".join(f"{label}) {choice}" for label, choice in zip(self.labels, self.choices))
+        return f"{self.question}\n{options}"
+
+    def __repr__(self):
+        return f"Question({self.question!r}, {self.answer!r}, choices={self.choices!r})"
+
+
+def _json_payload(text):
+    # Models outside constrained decoding sometimes wrap JSON in ``` fences or prose
+    start = text.find("{")
+    end = text.rfind("}")
+    if start == -1 or end < start:
+        raise SchemaError("no JSON object in response")
+    return text[start:end + 1]
+
+
+def _complete_items(text):
+    # Items of a "questions" array cut off mid-way (e.g. by max_tokens):
+    # decode item by item and keep every one that is complete
+    match = _QUESTIONS_ARRAY.search(text)
+    if not match:
+        return None
+    decoder = json.JSONDecoder()
+    items = []
+    pos = match.end()
+    while True:
+        pos = _ITEM_SEPARATOR.match(text, pos).end()
+        if pos >= len(text) or text[pos] == "]":
+            return items
+        try:
+            item, pos = decoder.raw_decode(text, pos)
+        except ValueError:
+            return items
+        items.append(item)
+
+
+def _string(value):
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return str(value)
+    if isinstance(value, str):
+        return value.strip()
+    return None
+
+
+def decode_questions(text, limit=None):
+    """Decode and validate a JSON response into Question objects in one pass.
+
+    Items missing a question or answer are dropped; a response that isn't a
+    {"questions": [...]} object raises SchemaError. A response truncated
+    inside the array (by the token cap) keeps its complete items. At most
+    limit questions are returned.
+    """
+    payload = _json_payload(text or "")
+    try:
+        data = json.loads(payload)
+    except ValueError as e:
+        data = None
+        items = _complete_items(text)
+        if not items:
+            raise SchemaError(f"invalid JSON: {e}") from e
+    if data is not None:
+        items = data.get("questions") if isinstance(data, dict) else None
+    if not isinstance(items, list):
+        raise SchemaError('expected an object with a "questions" array')
+
+    questions = []
+    for item in items:
+        if limit is not None and len(questions) >= limit:
+            break
+        if not isinstance(item, dict):
+            continue
+        question = _string(item.get("question"))
+        answer = _string(item.get("answer"))
+        if not question or not answer:
+            continue
+        choices = item.get("choices")
+        if isinstance(choices, list):
+            choices = [c for c in (_string(choice) for choice in choices) if c]
+        else:
+            choices = []
+        questions.append(Question(question, answer, choices))
+    return questions
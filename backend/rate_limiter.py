@@ -0,0 +1,151 @@
+# rate_limiter.py - Token-bucket rate limiting and fair request scheduling per provider/key
+import threading
+import time
+from collections import OrderedDict, deque
+
+# (requests per minute, tokens per minute) for each provider's free tier;
+# None means that dimension is not limited
+DEFAULT_LIMITS = {
+    "Google": (15, 1000000),
+    "Groq": (30, 6000),
+    "OpenRouter": (20, None),
+}
+DEFAULT_QUEUE_TIMEOUT = 120      # seconds a request may wait for a slot
+DEFAULT_COMPLETION_TOKENS = 1024  # expected output size when estimating usage
+
+
+def estimate_tokens(prompt, completion_tokens=DEFAULT_COMPLETION_TOKENS):
+    """Rough token estimate for a request (Thai text tokenizes densely)"""
+    return len(prompt) // 3 + completion_tokens
+
+
+class TokenBucket:
+    """Classic token bucket refilled continuously at rate_per_minute"""
+
+    def __init__(self, rate_per_minute, capacity=None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity or rate_per_minute
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def time_until(self, amount, now=None):
+        """Seconds until `amount` tokens are available (0 if available now)"""
+        now = time.monotonic() if now is None else now
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def consume(self, amount):
+        self.tokens -= min(amount, self.capacity)
+
+
+class RequestScheduler:
+    """Meters requests and tokens per minute for one (provider, API key).
+
+    Requests that don't fit the budget wait in per-session FIFO queues that
+    are served round-robin, so one busy session can't starve the others.
+    """
+
+    def __init__(self, requests_per_minute=None, tokens_per_minute=None):
+        self.request_bucket = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.token_bucket = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self._cond = threading.Condition()
+        self._queues = OrderedDict()  # session_id -> deque of waiting tickets
+        self.total_requests = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.timeouts = 0
+
+    def _next_ticket(self):
+        for queue in self._queues.values():
+            return queue[0]
+        return None
+
+    def _time_until_ready(self, tokens):
+        now = time.monotonic()
+        wait = 0.0
+        if self.request_bucket:
+            wait = max(wait, self.request_bucket.time_until(1, now))
+        if self.token_bucket:
+            wait = max(wait, self.token_bucket.time_until(tokens, now))
+        return wait
+
+    def _dequeue(self, session_id, ticket, served):
+        queue = self._queues[session_id]
+        queue.remove(ticket)
+        if not queue:
+            del self._queues[session_id]
+        elif served:
+            # Round-robin: this session goes to the back of the line
+            self._queues.move_to_end(session_id)
+
+    def acquire(self, session_id=None, tokens=0, timeout=DEFAULT_QUEUE_TIMEOUT):
+        """Block until the request may be sent; False if timeout expires first"""
+        ticket = object()
+        start = time.monotonic()
+        deadline = start + timeout if timeout is not None else None
+        with self._cond:
+            self._queues.setdefault(session_id, deque()).append(ticket)
+            while True:
+                remaining = deadline - time.monotonic() if deadline is not None else None
+                if remaining is not None and remaining <= 0:
+                    self._dequeue(session_id, ticket, served=False)
+                    self.timeouts += 1
+                    self._cond.notify_all()
+                    return False
+                if self._next_ticket() is ticket:
+                    wait = self._time_until_ready(tokens)
+                    if wait <= 0:
+                        if self.request_bucket:
+                            self.request_bucket.consume(1)
+                        if self.token_bucket:
+                            self.token_bucket.consume(tokens)
+                        self._dequeue(session_id, ticket, served=True)
+                        waited = time.monotonic() - start
+                        self.total_requests += 1
+                        self.total_wait += waited
+                        self.max_wait = max(self.max_wait, waited)
+                        self._cond.notify_all()
+                        return True
+                    self._cond.wait(wait if remaining is None else min(wait, remaining))
+                else:
+                    self._cond.wait(remaining)
+
+    def queue_depth(self):
+        """Number of requests currently waiting"""
+        with self._cond:
+            return sum(len(queue) for queue in self._queues.values())
+
+    def stats(self):
+        """Queue depth and wait-time statistics"""
+        with self._cond:
+            depth = sum(len(queue) for queue in self._queues.values())
+            return {
+                "queue_depth": depth,
+                "waiting_sessions": len(self._queues),
+                "total_requests": self.total_requests,
+                "avg_wait": self.total_wait / self.total_requests if self.total_requests else 0.0,
+                "max_wait": self.max_wait,
+                "timeouts": self.timeouts,
+            }
+
+
+_schedulers = {}
+_schedulers_lock = threading.Lock()
+
+
+def get_scheduler(provider_name, key_id):
+    """Return the shared scheduler for a provider and API key fingerprint"""
+    with _schedulers_lock:
+        scheduler = _schedulers.get((provider_name, key_id))
+        if scheduler is None:
+            requests_per_minute, tokens_per_minute = DEFAULT_LIMITS.get(provider_name, (None, None))
+            scheduler = RequestScheduler(requests_per_minute, tokens_per_minute)
+            _schedulers[(provider_name, key_id)] = scheduler
+        return scheduler
@@ -0,0 +1,124 @@
+# resilience.py - Error classification, jittered retries and a circuit breaker for AI calls
+import random
+import threading
+import time
+
+# Error kinds returned by classify_error()
+TRANSIENT = "transient"  # network blips, timeouts, 5xx: retry soon
+QUOTA = "quota"          # 429 / rate limit / quota exhausted: retry with longer waits
+AUTH = "auth"            # bad or revoked key: retrying won't help
+FATAL = "fatal"          # bad request and anything unrecognised
+
+_QUOTA_MARKERS = ("429", "rate limit", "rate_limit", "quota", "resource_exhausted", "too many requests")
+_AUTH_MARKERS = ("401", "403", "api key", "api_key", "unauthorized", "permission_denied", "forbidden",
+                 "unauthenticated")
+_TRANSIENT_MARKERS = ("timeout", "timed out", "connection", "temporarily", "unavailable",
+                      "overloaded", "500", "502", "503", "504", "internal")
+
+
+def _status_code(exc):
+    """HTTP status from groq/openai (status_code) or google-genai (code) errors"""
+    for attr in ("status_code", "code"):
+        value = getattr(exc, attr, None)
+        if isinstance(value, int):
+            return value
+    return None
+
+
+def classify_error(exc):
+    """Classify a provider exception as TRANSIENT, QUOTA, AUTH or FATAL"""
+    status = _status_code(exc)
+    message = f"{type(exc).__name__} {exc}".lower()
+    if status is not None:
+        if status == 429:
+            return QUOTA
+        if status in (401, 403):
+            return AUTH
+        if status == 408 or status >= 500:
+            return TRANSIENT
+        if 400 <= status < 500:
+            # Gemini rejects a bad key as 400 INVALID_ARGUMENT "API key not valid"
+            if any(marker in message for marker in _AUTH_MARKERS):
+                return AUTH
+            return FATAL
+    if isinstance(exc, (TimeoutError, ConnectionError)):
+        return TRANSIENT
+    if any(marker in message for marker in _QUOTA_MARKERS):
+        return QUOTA
+    if any(marker in message for marker in _AUTH_MARKERS):
+        return AUTH
+    if any(marker in message for marker in _TRANSIENT_MARKERS):
+        return TRANSIENT
+    return FATAL
+
+
+class RetryPolicy:
+    """Exponential backoff with full jitter; quota errors back off longer"""
+
+    def __init__(self, max_retries=3, base_delay=1.0, quota_base_delay=5.0, max_delay=30.0):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.quota_base_delay = quota_base_delay
+        self.max_delay = max_delay
+
+    def should_retry(self, kind, attempt):
+        return kind in (TRANSIENT, QUOTA) and attempt < self.max_retries
+
+    def delay(self, kind, attempt):
+        base = self.quota_base_delay if kind == QUOTA else self.base_delay
+        return random.uniform(0, min(self.max_delay, base * (2 ** attempt)))
+
+
+class CircuitBreaker:
+    """Closed -> open after repeated failures -> half-open after a cool-down.
+
+    While half-open a single request is let through as a probe; success
+    closes the circuit, failure opens it for another cool-down.
+    """
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold=5, cool_down=30.0):
+        self.failure_threshold = failure_threshold
+        self.cool_down = cool_down
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def is_available(self):
+        """True if a request could go through now (doesn't claim the probe)"""
+        with self._lock:
+            if self.state == self.OPEN:
+                return time.monotonic() - self.opened_at >= self.cool_down
+            return True
+
+    def allow_request(self):
+        """Claim permission to send a request"""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.cool_down:
+                self.state = self.HALF_OPEN
+                return True
+            # Open and cooling down, or a half-open probe is already in flight
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+    def trip(self):
+        """Open immediately (e.g. the key was rejected)"""
+        with self._lock:
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
@@ -0,0 +1,162 @@
+# response_parser.py - Single-pass, incremental parsing of AI question/answer output
+import re
+
+from .question_schema import THAI_CHOICE_LABELS, Question
+
+_MARKDOWN = re.compile(r'[*#`]+')
+# One anchored alternation classifies each line in a single regex call; the
+# first matching branch wins, so the order of the branches matters.
+# A bare "A:" is ambiguous: the answer in Q:/A: output, or option A in "A: / B: / C: / D:" output.
+_LINE = re.compile(r"""
+    (?P<questions_header>(?:questions?|คำถาม|แบบฝึกหัด)\s*:?$)
+  | (?:Q|Question|คำถาม|ข้อ)\s*(?:ที่)?\s*(?P<number>\d*)\s*[:.)]\s*(?P<question>.*)
+  | A\s*\d*\s*:\s*(?P<bare_a>.+)
+  | (?:Ans|Answer|Correct\ answer|คำตอบ|เฉลย)\s*(?:ที่)?\s*\d*\s*[:.)]\s*(?P<answer>.+)
+  | (?P<answers_header>(?:answers?|answer\ key|solutions?|เฉลย|คำตอบ)\b.*)
+  | \(?(?P<label>[A-Da-dก-ง])\s*[).:]\s*(?P<choice>.+)
+  | \d+\s*[.)]\s*(?P<numbered>.+)
+  | [-•]\s*(?P<bullet>.+)
+""", re.IGNORECASE | re.VERBOSE)
+
+
+class StreamingQAParser:
+    """Turns AI text into questions and answers in a single pass over its lines.
+
+    Recognised formats, which may be mixed:
+    - interleaved "Q: / A:" lines
+    - a numbered (or bulleted) questions list followed by an "Answers:" / "เฉลย" section
+    - multiple choice: "A) / B) ..." or "ก. / ข. ..." options (also "A: / B: ...")
+      followed by "Ans: <letter>"
+
+    Feed text chunks of any size; only whole lines are parsed, and each line
+    is looked at once. feed() and close() return the (question, answer)
+    pairs completed so far, in order.
+    """
+
+    def __init__(self):
+        self._buffer = ""
+        self.section = "questions"
+        self.questions = []
+        self._pending_a = None   # text of a bare "A:" line not yet known to be an answer or option A
+        self._next_answer = 0    # first question an answer-section line would belong to
+        self._emitted = 0
+
+    def feed(self, chunk):
+        """Add streamed text; return the pairs completed by it"""
+        if "\n" not in chunk:
+            self._buffer += chunk
+            return []
+        text = self._buffer + chunk
+        end = text.rindex("\n")
+        self._buffer = text[end + 1:]
+        self._parse_lines(text[:end])
+        return self._take_completed()
+
+    def close(self):
+        """Parse the final unterminated line; return any pairs it completes"""
+        if self._buffer:
+            self._parse_lines(self._buffer)
+            self._buffer = ""
+        self._flush_pending()
+        return self._take_completed()
+
+    def _parse_lines(self, text):
+        # Markdown is removed from the whole batch of lines in one call
+        if "*" in text or "#" in text or "`" in text:
+            text = _MARKDOWN.sub("", text)
+        handle_line = self._handle_line
+        for line in text.split("\n"):
+            handle_line(line)
+
+    def _flush_pending(self):
+        if self._pending_a is not None:
+            self._set_answer(self._pending_a, current=True)
+            self._pending_a = None
+
+    def _set_answer(self, text, current=False):
+        # current=True: an inline answer for the question just asked;
+        # otherwise the next question in order (numbered answer section)
+        if current and self.questions and self.questions[-1].answer is None:
+            index = len(self.questions) - 1
+        else:
+            index = self._next_answer
+            while index < len(self.questions) and self.questions[index].answer is not None:
+                index += 1
+            if index >= len(self.questions):
+                return
+        self.questions[index].answer = text
+        self._next_answer = index + 1
+
+    def _handle_line(self, line):
+        # line has had its markdown removed; groups need no strip() since
+        # the line is stripped and each group follows a \s*
+        line = line.strip()
+        if not line:
+            return
+        match = _LINE.match(line)
+        kind = match.lastgroup if match else None
+
+        if self._pending_a is not None:
+            if kind == "choice" and match.group("label") in "Bb":
+                # "A:" turned out to be option A of a multiple-choice question
+                self.questions[-1].choices.append(self._pending_a)
+                self._pending_a = None
+            else:
+                self._flush_pending()
+
+        if kind is None:
+            return
+        if kind == "questions_header":
+            self.section = "questions"
+        elif kind == "question":
+            text = match.group("question")
+            if self.section == "answers" and match.group("number"):
+                # "ข้อ 1. ..." / "Q1: ..." in an answer section numbers an answer
+                if text:
+                    self._set_answer(text)
+                return
+            if text:
+                self.questions.append(Question(text, None))
+            self.section = "questions"
+        elif kind == "bare_a" or kind == "answer":
+            text = match.group(kind)
+            current = self.questions[-1] if self.questions else None
+            if (kind == "bare_a" and self.section == "questions" and current is not None
+                    and current.answer is None and not current.choices):
+                self._pending_a = text
+            else:
+                self._set_answer(text, current=self.section == "questions")
+        elif kind == "answers_header":
+            self.section = "answers"
+        elif kind == "choice":
+            if self.section == "questions" and self.questions and self.questions[-1].answer is None:
+                current = self.questions[-1]
+                label = match.group("label")
+                if not current.choices and label in THAI_CHOICE_LABELS:
+                    current.labels = THAI_CHOICE_LABELS
+                current.choices.append(match.group("choice"))
+        else:
+            text = match.group(kind)
+            if self.section == "answers":
+                self._set_answer(text)
+            else:
+                self.questions.append(Question(text, None))
+
+    def _take_completed(self):
+        # Questions skipped over by an answer are abandoned, never emitted
+        pairs = []
+        while self._emitted < self._next_answer:
+            question = self.questions[self._emitted]
+            if question.answer is not None:
+                pairs.append((question.text, question.answer))
+            self._emitted += 1
+        return pairs
+
+
+def parse_questions(text):
+    """Parse a complete AI response into Question objects (answer is None where missing)"""
+    parser = StreamingQAParser()
+    # No pairs are needed, so the parse skips feed()/close()'s pair building
+    parser._parse_lines(text)
+    parser._flush_pending()
+    return parser.questions
@@ -0,0 +1,82 @@
+# single_flight.py - Coalesce identical in-flight AI calls into one provider request
+import threading
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Runs one call per key at a time; concurrent callers with the same key
+    wait for that call and all receive its result.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.executed = 0   # calls that actually reached the provider
+        self.coalesced = 0  # calls saved by sharing an in-flight result
+
+    def do(self, key, fn):
+        call, leader = self.join(key)
+        if not leader:
+            return self.wait(call)
+        try:
+            result = fn()
+        except Exception as e:
+            self.finish(key, call, error=e)
+            raise
+        self.finish(key, call, result)
+        return result
+
+    def join(self, key):
+        """Register interest in key; returns (call, leader).
+
+        For callers that can't wrap their work in one function (e.g. a
+        stream consumed by a generator): the leader must call finish(),
+        followers call wait().
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = self._calls[key] = _Call()
+                self.executed += 1
+                return call, True
+            self.coalesced += 1
+            return call, False
+
+    def wait(self, call):
+        """Block until the leader finishes; return its result or raise its error"""
+        call.done.wait()
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    def finish(self, key, call, result=None, error=None):
+        """Publish the leader's result (or error) to its followers"""
+        call.result = result
+        call.error = error
+        with self._lock:
+            if self._calls.get(key) is call:
+                del self._calls[key]
+        call.done.set()
+
+    def stats(self):
+        """How many provider calls ran and how many were saved"""
+        with self._lock:
+            return {
+                "executed": self.executed,
+                "coalesced": self.coalesced,
+                "in_flight": len(self._calls),
+            }
+
+
+_ai_flight = SingleFlight()
+
+
+def get_ai_flight():
+    """Process-wide single-flight group for AI prompts"""
+    return _ai_flight
@@ -0,0 +1,116 @@
+# text_chunks.py - Split long documents into token-budgeted chunks
+import re
+
+from .rate_limiter import estimate_tokens
+
+DEFAULT_CHUNK_TOKENS = 1500
+CHARS_PER_TOKEN = 3  # matches estimate_tokens (Thai text tokenizes densely)
+
+_PARAGRAPH_BREAK = re.compile(r'\n\s*\n')
+
+
+class TextChunk:
+    """A contiguous piece of a document; start is its character offset in the full text"""
+
+    __slots__ = ("index", "start", "text")
+
+    def __init__(self, index, start, text):
+        self.index = index
+        self.start = start
+        self.text = text
+
+    @property
+    def end(self):
+        return self.start + len(self.text)
+
+    @property
+    def tokens(self):
+        return estimate_tokens(self.text, 0)
+
+    def __repr__(self):
+        return f"TextChunk({self.index}, start={self.start}, tokens={self.tokens})"
+
+
+def _segments(text, max_chars):
+    # Paragraph spans; paragraphs over max_chars are cut at the last space before the limit
+    pos = 0
+    for match in list(_PARAGRAPH_BREAK.finditer(text)) + [None]:
+        end = match.start() if match else len(text)
+        seg_start = pos
+        while end - seg_start > max_chars:
+            low, high = seg_start + max_chars // 2, seg_start + max_chars
+            cut = max(text.rfind(" ", low, high), text.rfind("\n", low, high))
+            if cut <= seg_start:
+                cut = high
+            yield seg_start, cut
+            seg_start = cut
+        if end > seg_start:
+            yield seg_start, end
+        pos = match.end() if match else len(text)
+
+
+def chunk_text(text, max_tokens=DEFAULT_CHUNK_TOKENS):
+    """Split text into TextChunks of at most max_tokens, breaking between paragraphs where possible"""
+    max_chars = max(1, max_tokens * CHARS_PER_TOKEN)
+    chunks = []
+    start = end = None
+
+    def emit():
+        piece = text[start:end]
+        stripped = piece.strip()
+        if stripped:
+            lead = len(piece) - len(piece.lstrip())
+            chunks.append(TextChunk(len(chunks), start + lead, stripped))
+
+    for seg_start, seg_end in _segments(text or "", max_chars):
+        if start is not None and seg_end - start > max_chars:
+            emit()
+            start = None
+        if start is None:
+            start = seg_start
+        end = seg_end
+    if start is not None:
+        emit()
+    return chunks
+
+
+def chunk_stream(pieces, max_tokens=DEFAULT_CHUNK_TOKENS):
+    """Group streamed TextChunks (e.g. extracted pages) into TextChunks of at most max_tokens.
+
+    Each chunk is yielded as soon as it is full, so downstream work can start
+    before the whole document has been read. Pieces are assumed contiguous
+    (piece.start is its offset in the full text); a piece over max_tokens is
+    split with chunk_text.
+    """
+    max_chars = max(1, max_tokens * CHARS_PER_TOKEN)
+    index = 0
+    parts = []
+    size = 0
+    start = 0
+
+    def emit():
+        piece = "".join(parts)
+        stripped = piece.strip()
+        if stripped:
+            return TextChunk(index, start + len(piece) - len(piece.lstrip()), stripped)
+
+    for piece in pieces:
+        if parts and size + len(piece.text) > max_chars:
+            chunk = emit()
+            if chunk:
+                yield chunk
+                index += 1
+            parts, size = [], 0
+        if len(piece.text) > max_chars:
+            for sub in chunk_text(piece.text, max_tokens):
+                yield TextChunk(index, piece.start + sub.start, sub.text)
+                index += 1
+            continue
+        if not parts:
+            start = piece.start
+        parts.append(piece.text)
+        size += len(piece.text)
+    if parts:
+        chunk = emit()
+        if chunk:
+            yield chunk
@@ -1,17 +1,142 @@
 # worksheet_generator.py - Main worksheet generator class
+import asyncio
+import functools
+import hashlib
+import itertools
 import random
 import io
-from .ai_providers import create_ai_provider
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from .document_text import extract_document_text, iter_document_text
+from .extraction_cache import get_extraction_cache
+from .provider_chain import ProviderChain
+from .provider_registry import get_shared_provider
+from .question_schema import QUESTION_SCHEMA, SchemaError, decode_questions
+from .rate_limiter import estimate_tokens
+from .response_cache import get_response_cache, make_cache_key
+from .response_parser import StreamingQAParser, parse_questions
+from .single_flight import get_ai_flight
+from .passage_index import select_passages
+from .text_chunks import CHARS_PER_TOKEN, chunk_stream, chunk_text
 from .generators import MathGenerator, ScienceGenerator, ThaiGenerator, EnglishGenerator, SocialStudiesGenerator
 from .exporters import PDFExporter, DocxExporter
 
+# Upper bound on AI calls one request may run at the same time
+MAX_CONCURRENT_AI_CALLS = 3
+
+# Hedged requests: fire the backup provider once the primary is slower
+# than this percentile of its recent latencies
+HEDGE_PERCENTILE = 95
+HEDGE_MIN_SAMPLES = 20     # below this, use DEFAULT_HEDGE_DELAY instead
+DEFAULT_HEDGE_DELAY = 8.0  # seconds
+
+# Completion budget per request, sized to the number of questions asked for
+TOKENS_PER_QUESTION = 160
+JSON_TOKENS_PER_QUESTION = 240  # JSON keys, quoting and choices arrays cost extra tokens
+MAX_TOKENS_OVERHEAD = 200
+
+# Follow-up requests for just the missing questions when the AI returns too few
+MAX_TOPUP_ROUNDS = 2
+
+# Large question counts are split into concurrent sub-requests of about FANOUT_BATCH_SIZE
+FANOUT_THRESHOLD = 15
+FANOUT_BATCH_SIZE = 10
+FANOUT_MAX_CONCURRENCY = 5  # 50 questions (the UI maximum) in a single wave
+
+# Each sub-request is steered towards a different kind of question so the parts don't overlap
+DIVERSITY_HINTS = [
+    "focus on key facts, terms and definitions",
+    "focus on understanding: ask students to explain ideas in their own words",
+    "focus on applying the ideas to new, everyday situations",
+    "focus on comparing, classifying and reasoning about cause and effect",
+    "focus on details and examples that other questions are likely to miss",
+]
+
+# Documents longer than QUIZ_CONTEXT_TOKENS are quizzed chunk by chunk (map-reduce):
+# at most MAP_MAX_CHUNKS map requests, so longer documents get bigger chunks
+QUIZ_CONTEXT_TOKENS = 1500
+MAP_MAX_CHUNKS = 12
+MAP_MAX_CHUNK_TOKENS = 6000
+MAP_OVERSAMPLE = 1.5       # candidate questions generated per question kept
+MAP_MAX_CONCURRENCY = 4
+# Longer documents are first cut down to their most relevant passages (BM25)
+QUIZ_CONTEXT_BUDGET = 12000
+
+# Hierarchical summaries: chunks are summarized in parallel, then the partial
+# summaries are merged (recursively, while they are still too long for one request)
+SUMMARY_CHUNK_TOKENS = 3000
+SUMMARY_MIN_PART_CHARS = 400
+SUMMARY_MAX_PART_CHARS = 1500
+SUMMARY_MAX_CONCURRENCY = 4
+SUMMARY_CACHE_NAMESPACE = "summary-v1"  # bump when the summary prompts change
+
+# Threads for hedged calls; a losing call finishes here and is discarded
+_hedge_pool = ThreadPoolExecutor(max_workers=16, thread_name_prefix="ai-hedge")
+
+# Template text used when AI generation is unavailable, per subject
+TEMPLATE_QUESTIONS = {
+    "Science": ("คำถามเกี่ยวกับ {topic}", "คำตอบสำหรับ {topic}"),
+    "Chemistry": ("คำถามเคมีเกี่ยวกับ {topic}", "คำตอบ"),
+    "Physics": ("คำถามฟิสิกส์เกี่ยวกับ {topic}", "คำตอบ"),
+    "Biology": ("คำถามชีววิทยาเกี่ยวกับ {topic}", "คำตอบ"),
+    "Thai Language": ("แบบฝึกหัดภาษาไทยเกี่ยวกับ {topic}", "คำตอบ"),
+    "Social Studies": ("คำถามสังคมศึกษาเกี่ยวกับ {topic}", "คำตอบสำหรับ {topic}"),
+}
+
+def _decodes(response):
+    """True if a JSON response yields at least one complete question"""
+    try:
+        return bool(decode_questions(response, limit=1))
+    except SchemaError:
+        return False
+
+
+def _parses(response):
+    """True if a free-text response yields at least one answered question"""
+    return any(item.answer is not None for item in parse_questions(response))
+
+
+def _question_key(text):
+    """Normalised question text for spotting duplicates"""
+    return " ".join(text.casefold().split())
+
+
+def _proportional_quotas(weights, total):
+    """Split total into integer shares proportional to weights (largest remainder)"""
+    weight_sum = sum(weights) or 1
+    exact = [total * w / weight_sum for w in weights]
+    quotas = [int(x) for x in exact]
+    by_remainder = sorted(range(len(weights)), key=lambda i: exact[i] - quotas[i], reverse=True)
+    for i in by_remainder[:total - sum(quotas)]:
+        quotas[i] += 1
+    return quotas
+
+
+def _split_count(num_questions, batch_size=FANOUT_BATCH_SIZE):
+    """Split num_questions into near-equal batches of at most batch_size"""
+    batches = -(-num_questions // batch_size)
+    base, extra = divmod(num_questions, batches)
+    return [base + (1 if i < extra else 0) for i in range(batches)]
+
+
 class WorksheetGenerator:
     """Main class for generating worksheets"""
     
-    def __init__(self, ai_api_key=None, provider="Google Gemini"):
+    def __init__(self, ai_api_key=None, provider="Google Gemini", use_cache=True, session_id=None,
+                 hedge_provider=None, hedge_api_key=None, hedge_percentile=HEDGE_PERCENTILE,
+                 fallback_providers=None, json_mode=True, provider_options=None):
         self.provider = provider
         self.ai_api_key = ai_api_key
+        # Identifies this user session to the provider's fair request scheduler
+        self.session_id = session_id or uuid.uuid4().hex
         self.ai = None
+        self.response_cache = get_response_cache() if use_cache else None
+        # Text of uploaded files, keyed by the hash of their bytes
+        self.extraction_cache = get_extraction_cache() if use_cache else None
+        # Ask providers that support it for schema-constrained JSON instead of free text
+        self.json_mode = json_mode
         
         # Initialize generators
         self.math_gen = MathGenerator()
@@ -22,15 +147,53 @@ class WorksheetGenerator:
         self.pdf_exp = PDFExporter()
         self.docx_exp = DocxExporter()
         
-        # Initialize AI provider
-        if ai_api_key:
-            self.ai = create_ai_provider(provider, ai_api_key)
+        # Shared provider per (provider, key): no network calls, health is probed in the background.
+        # fallback_providers is an ordered list of (provider, api_key) tried when the primary fails.
+        # provider_options maps a provider name to its constructor options,
+        # e.g. {"Google Gemini": {"pool_size": 20, "keepalive_expiry": 60.0}}.
+        self.provider_options = provider_options or {}
+        chain = [(provider, self._shared_provider(provider, ai_api_key))] if ai_api_key else []
+        for fallback_name, fallback_key in fallback_providers or []:
+            if fallback_key and fallback_name != provider:
+                chain.append((fallback_name, self._shared_provider(fallback_name, fallback_key)))
+        chain = [(name, ai) for name, ai in chain if ai]
+        if chain:
+            self.ai = ProviderChain(chain) if len(chain) > 1 else chain[0][1]
+            if self.ai:
+                self.ai.check_health(background=True)
+        
+        # Optional backup provider for hedged requests (e.g. Groq behind Gemini)
+        self.hedge_ai = None
+        self.hedge_percentile = hedge_percentile
+        self.hedge_stats = {"hedged": 0, "hedge_wins": 0}
+        # Per-request completion token accounting for streamed generation
+        self.token_stats = deque(maxlen=100)
+        self.topup_stats = {"topups": 0, "questions_requested": 0, "questions_added": 0}
+        self.fanout_stats = deque(maxlen=50)
+        if hedge_provider and hedge_api_key:
+            self.hedge_ai = self._shared_provider(hedge_provider, hedge_api_key)
+    
+    def _shared_provider(self, provider_name, api_key):
+        """Shared provider for this name and key, built with its provider_options"""
+        return get_shared_provider(provider_name, api_key, **self.provider_options.get(provider_name, {}))
     
     # ===== Math Methods =====
     def generate_questions(self, operation, num_questions, d_min, d_max):
         """Generate math questions"""
         return self.math_gen.generate_questions(operation, num_questions, d_min, d_max)
     
+    # ===== File Text Extraction =====
+    def extract_text_from_file(self, uploaded_file, pages=None):
+        """Extract the text of an uploaded PDF or Word file (cached by content hash).
+        
+        pages limits a PDF to a page range such as "3-7, 10"; only those pages are decoded.
+        """
+        return extract_document_text(uploaded_file, cache=self.extraction_cache, pages=pages)
+    
+    def iter_text_from_file(self, uploaded_file, pages=None):
+        """Yield the text of an uploaded PDF or Word file page by page (or paragraph by paragraph)"""
+        return iter_document_text(uploaded_file, cache=self.extraction_cache, pages=pages)
+    
     # ===== PDF Export Methods =====
     def create_pdf(self, title, school_name, topic, questions, answers, qr_url=None, uploaded_logo=None):
         """Create PDF worksheet"""
@@ -57,6 +220,14 @@ class WorksheetGenerator:
         """Create tracing Word document"""
         return self.docx_exp.create_tracing_doc(title, school_name, topic, lines)
     
+    def create_summary_pdf(self, title, school_name, topic, summary, qr_url=None, logo=None):
+        """Create summary PDF"""
+        return self.pdf_exp.create_summary_pdf(title, school_name, topic, summary, qr_url, logo)
+    
+    def create_summary_word_doc(self, title, school_name, topic, summary):
+        """Create summary Word document"""
+        return self.docx_exp.create_summary_doc(title, school_name, topic, summary)
+    
     # ===== Word Search =====
     def generate_word_search(self, words, grid_size=12):
         """Generate word search puzzle"""
@@ -111,10 +282,125 @@ class WorksheetGenerator:
         return [line.strip() for line in text.split(',') if line.strip()]
     
     # ===== AI Generation Methods =====
-    def _call_ai(self, prompt):
-        """Call AI provider to generate content"""
-        if self.ai:
-            return self.ai.generate(prompt)
+    def _max_tokens_for(self, num_questions, json_output=False):
+        """Completion token cap for a request of num_questions Q/A pairs"""
+        per_question = JSON_TOKENS_PER_QUESTION if json_output else TOKENS_PER_QUESTION
+        return MAX_TOKENS_OVERHEAD + per_question * max(1, num_questions)
+    
+    def _model_key(self):
+        """Model name for cache and single-flight keys, resolved before the call
+        (Gemini picks its model lazily, so model_name is None until then)"""
+        resolve = getattr(self.ai, 'resolve_model', None)
+        return resolve() if resolve else getattr(self.ai, 'model_name', None)
+    
+    def _call_ai(self, prompt, max_tokens=None, json_schema=None, use_cache=True, validate=None):
+        """Call AI provider to generate content.
+        
+        Served from the response cache when possible; identical prompts
+        already in flight (from any session) share that one provider call.
+        use_cache=False is for callers that cache results under their own key.
+        With validate, only responses for which validate(response) is true
+        are cached or served from the cache.
+        """
+        if not self.ai:
+            return None
+        model = self._model_key()
+        use_cache = use_cache and self.response_cache is not None
+        if use_cache:
+            cached = self.response_cache.get(prompt, self.provider, model)
+            if cached is not None and (validate is None or validate(cached)):
+                return cached
+        
+        def fetch():
+            if self.hedge_ai:
+                result = self._generate_hedged(prompt, max_tokens, json_schema)
+            else:
+                result = self.ai.generate(prompt, session_id=self.session_id, max_tokens=max_tokens,
+                                          json_schema=json_schema)
+            if result and use_cache and (validate is None or validate(result)):
+                self.response_cache.put(prompt, self.provider, model, result)
+            return result
+        
+        return get_ai_flight().do(make_cache_key(prompt, self.provider, model), fetch)
+    
+    def _hedge_delay(self):
+        """Seconds to wait for the primary before firing the backup provider"""
+        if self.ai.latency.count >= HEDGE_MIN_SAMPLES:
+            return self.ai.latency.percentile(self.hedge_percentile)
+        return DEFAULT_HEDGE_DELAY
+    
+    def _generate_hedged(self, prompt, max_tokens=None, json_schema=None):
+        """Send to the primary; if it is slow, also send to the backup and take the first answer.
+        
+        The slower call can't be aborted mid-request by the SDKs, so it is
+        left to finish on the hedge pool and its result is discarded.
+        """
+        primary = _hedge_pool.submit(self.ai.generate, prompt, self.session_id, max_tokens, json_schema)
+        done, _ = wait([primary], timeout=self._hedge_delay())
+        if done and primary.result():
+            return primary.result()
+        
+        self.hedge_stats["hedged"] += 1
+        backup = _hedge_pool.submit(self.hedge_ai.generate, prompt, self.session_id, max_tokens, json_schema)
+        pending = {primary, backup}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                result = future.result()
+                if result:
+                    if future is backup:
+                        self.hedge_stats["hedge_wins"] += 1
+                    for other in pending:
+                        other.cancel()
+                    return result
+        return None
+    
+    def get_latency_stats(self):
+        """Latency histograms of the primary (and hedge) provider"""
+        stats = {}
+        if self.ai and hasattr(self.ai, 'latency'):
+            stats[self.provider] = self.ai.latency.snapshot()
+        if self.hedge_ai:
+            stats["hedge"] = dict(self.hedge_ai.latency.snapshot(), **self.hedge_stats)
+        return stats
+    
+    def get_cache_stats(self):
+        """Return AI response cache hit/miss counters"""
+        if self.response_cache:
+            return self.response_cache.stats()
+        return None
+    
+    def get_extraction_cache_stats(self):
+        """Return uploaded-file text cache hit/miss counters and size"""
+        if self.extraction_cache:
+            return self.extraction_cache.stats()
+        return None
+    
+    def get_token_stats(self):
+        """Completion tokens used and saved by stopping streams early, per request and in total"""
+        requests = list(self.token_stats)
+        return {
+            "requests": requests,
+            "tokens_used": sum(r["tokens_used"] for r in requests),
+            "tokens_saved": sum(r["tokens_saved"] for r in requests),
+        }
+    
+    def get_coalescing_stats(self):
+        """How many AI calls were saved by sharing identical in-flight prompts"""
+        return get_ai_flight().stats()
+    
+    def get_rate_limit_stats(self):
+        """Return queue depth and wait times of the provider's request scheduler"""
+        if self.ai and hasattr(self.ai, 'scheduler'):
+            return self.ai.scheduler.stats()
+        if isinstance(self.ai, ProviderChain):
+            return {name: ai.scheduler.stats() for name, ai in self.ai.providers}
+        return None
+    
+    def get_provider_health(self):
+        """Rolling health of each provider in the failover chain (None without a chain)"""
+        if isinstance(self.ai, ProviderChain):
+            return self.ai.stats()
         return None
     
     def is_ai_working(self):
@@ -123,41 +409,240 @@ class WorksheetGenerator:
             return self.ai.test_connection()
         return False
     
-    def _create_ai_prompt(self, subject, topic, grade, num_questions, exercise_type="mix"):
-        """Create AI prompt for worksheet generation"""
+    def check_ai_health(self, background=False):
+        """Run (or reuse a cached) live health probe of the AI provider"""
+        if self.ai and hasattr(self.ai, 'check_health'):
+            return self.ai.check_health(background=background)
+        return False
+    
+    def _create_ai_prompt(self, subject, topic, grade, num_questions, exercise_type="mix", output_format="numbered"):
+        """Create AI prompt for worksheet generation (see _format_instructions for output_format)"""
+        return f"""{self._prompt_body(subject, topic, grade, num_questions, exercise_type)}
+
+{self._format_instructions(output_format)}"""
+    
+    def _prompt_body(self, subject, topic, grade, num_questions, exercise_type="mix"):
+        """Task description of a subject worksheet prompt, without output format"""
         return f"""Create {num_questions} {subject} exercises for Thai students.
 Grade: {grade}
 Topic: {topic}
 Exercise Type: {exercise_type}
 
 Please provide questions and answers in Thai format.
-Questions should be age-appropriate and educational.
-
-Format:
+Questions should be age-appropriate and educational."""
+    
+    def _format_instructions(self, output_format="numbered", question_hint="question", answer_hint="answer"):
+        """Output format section of a prompt.
+        
+        "numbered": a Questions: list followed by an Answers: list.
+        "interleaved": each answer right after its question, so streamed
+        output yields complete pairs early.
+        "json": a {"questions": [...]} object matching QUESTION_SCHEMA.
+        """
+        if output_format == "json":
+            return f"""Respond with JSON only, in this shape:
+{{"questions": [{{"question": "[{question_hint}]", "answer": "[{answer_hint}]"}}]}}
+For multiple-choice questions add "choices": ["...", "...", "...", "..."] and give the correct choice as the answer."""
+        if output_format == "interleaved":
+            return f"""Format (write each answer directly after its question):
+Q: [{question_hint} 1]
+A: [{answer_hint} 1]
+Q: [{question_hint} 2]
+A: [{answer_hint} 2]
+..."""
+        return f"""Format:
 Questions:
-1. [question 1]
-2. [question 2]
+1. [{question_hint} 1]
+2. [{question_hint} 2]
 ...
 
 Answers:
-1. [answer 1]
-2. [answer 2]
+1. [{answer_hint} 1]
+2. [{answer_hint} 2]
 ..."""
     
+    def _request_questions(self, body, num_questions, question_hint="question", answer_hint="answer", keep_extra=False):
+        """One AI request for num_questions Q/A pairs; returns Question objects, or None if the call failed.
+        
+        Extra questions beyond num_questions are dropped unless keep_extra is set.
+        Providers with structured output get a JSON schema, and the reply is
+        decoded and validated in one pass. Free-text parsing is only used for
+        other providers, or if a JSON reply is rejected.
+        """
+        max_tokens = self._max_tokens_for(num_questions)
+        if self.json_mode and getattr(self.ai, 'supports_json_schema', False):
+            prompt = f"{body}\n\n{self._format_instructions('json', question_hint, answer_hint)}"
+            result = self._call_ai(prompt, self._max_tokens_for(num_questions, json_output=True),
+                                   json_schema=QUESTION_SCHEMA, validate=_decodes)
+            if not result:
+                return None
+            try:
+                items = decode_questions(result, limit=None if keep_extra else num_questions)
+            except SchemaError as e:
+                print(f"[!] AI JSON response rejected: {e}")
+            else:
+                if items:
+                    return items
+                print("[!] AI JSON response had no complete questions")
+        
+        prompt = f"{body}\n\n{self._format_instructions('numbered', question_hint, answer_hint)}"
+        result = self._call_ai(prompt, max_tokens, validate=_parses)
+        if result is None:
+            return None
+        items = parse_questions(result)
+        return items if keep_extra else items[:num_questions]
+    
+    def _ai_questions(self, body, num_questions, question_hint="question", answer_hint="answer"):
+        """Ask the AI for num_questions Q/A pairs; returns (questions, answers) or None.
+        
+        A short answer is topped up with requests for only the missing questions.
+        """
+        items = self._request_questions(body, num_questions, question_hint, answer_hint)
+        if items is None:
+            return None
+        answered = [item for item in items if item.answer is not None]
+        if not answered:
+            # Nothing answered, so no basis for a top-up: use placeholder answers
+            return self._with_placeholders(items, num_questions)
+        questions = [item.text for item in answered]
+        answers = [item.answer for item in answered]
+        if len(questions) < num_questions:
+            self._top_up(body, questions, answers, num_questions, question_hint, answer_hint)
+        return questions, answers
+    
+    def _topup_body(self, body, existing_questions, missing):
+        """Prompt body asking for only the missing questions, listing the ones we already have"""
+        existing = "\n".join(f"- {q}" for q in existing_questions)
+        return f"""{body}
+
+These {len(existing_questions)} questions have already been written:
+{existing}
+
+Write only {missing} NEW questions (with answers) that do not repeat or rephrase the ones above."""
+    
+    def _top_up(self, body, questions, answers, num_questions, question_hint="question", answer_hint="answer"):
+        """Extend questions/answers in place up to num_questions, asking only for the shortfall.
+        
+        Returns the (question, answer) pairs that were added.
+        """
+        added = []
+        seen = {_question_key(q) for q in questions}
+        for _ in range(MAX_TOPUP_ROUNDS):
+            missing = num_questions - len(questions)
+            if missing <= 0:
+                break
+            print(f"[INFO] AI returned {len(questions)}/{num_questions} questions, requesting {missing} more")
+            self.topup_stats["topups"] += 1
+            self.topup_stats["questions_requested"] += missing
+            # Keep any surplus: some of it may replace duplicates that get dropped
+            items = self._request_questions(self._topup_body(body, questions, missing), missing,
+                                            question_hint, answer_hint, keep_extra=True)
+            new_pairs = []
+            for item in items or []:
+                key = _question_key(item.text)
+                if item.answer is None or key in seen or len(new_pairs) >= missing:
+                    continue
+                seen.add(key)
+                new_pairs.append((item.text, item.answer))
+            if not new_pairs:
+                break
+            for question, answer in new_pairs:
+                questions.append(question)
+                answers.append(answer)
+            added.extend(new_pairs)
+            self.topup_stats["questions_added"] += len(new_pairs)
+        return added
+    
+    def _fanout_questions(self, make_body, num_questions, question_hint="question", answer_hint="answer",
+                          max_concurrency=FANOUT_MAX_CONCURRENCY):
+        """Generate a large question set as several smaller concurrent requests.
+        
+        make_body(count) returns the task prompt for count questions. Each part
+        gets a different diversity hint; the parts are merged in order,
+        de-duplicated and topped up if still short. Returns (questions, answers) or None.
+        """
+        counts = _split_count(num_questions)
+        bodies = [
+            f"{make_body(count)}\n\nFor variety, {DIVERSITY_HINTS[i % len(DIVERSITY_HINTS)]}. "
+            f"(This is part {i + 1} of {len(counts)}; other parts cover other kinds of questions.)"
+            for i, count in enumerate(counts)
+        ]
+        start = time.monotonic()
+        results = asyncio.run(self._afanout(bodies, counts, question_hint, answer_hint, max_concurrency))
+        
+        # First each part's own share, then any surplus to replace duplicates
+        questions, answers, seen = [], [], set()
+        surplus = []
+        for (items, _), count in zip(results, counts):
+            taken = 0
+            for item in items or []:
+                key = _question_key(item.text)
+                if item.answer is None or key in seen:
+                    continue
+                if taken >= count:
+                    surplus.append(item)
+                    continue
+                seen.add(key)
+                questions.append(item.text)
+                answers.append(item.answer)
+                taken += 1
+        for item in surplus:
+            key = _question_key(item.text)
+            if len(questions) >= num_questions or key in seen:
+                continue
+            seen.add(key)
+            questions.append(item.text)
+            answers.append(item.answer)
+        if not questions:
+            return None
+        if len(questions) < num_questions:
+            self._top_up(make_body(num_questions), questions, answers, num_questions, question_hint, answer_hint)
+        
+        wall = time.monotonic() - start
+        part_seconds = sum(elapsed for _, elapsed in results)
+        self.fanout_stats.append({
+            "questions": num_questions,
+            "parts": len(counts),
+            "received": len(questions),
+            "wall_seconds": round(wall, 2),
+            # The parts run back to back: an upper bound, not a single-shot
+            # measurement, since every part pays its own time to first token
+            # (benchmarks/bench_fanout.py measures the real single-shot call)
+            "sum_part_seconds": round(part_seconds, 2),
+        })
+        print(f"[INFO] Fan-out: {len(questions)}/{num_questions} questions in {len(counts)} parts, "
+              f"{wall:.1f}s ({part_seconds:.1f}s summed over parts)")
+        return questions, answers
+    
+    async def _afanout(self, bodies, counts, question_hint, answer_hint, max_concurrency):
+        """Run the fan-out parts concurrently; returns (items, seconds) per part, in order"""
+        semaphore = asyncio.Semaphore(max_concurrency)
+        loop = asyncio.get_running_loop()
+        
+        async def run(body, count):
+            async with semaphore:
+                part_start = time.monotonic()
+                items = await loop.run_in_executor(
+                    None, self._request_questions, body, count, question_hint, answer_hint, True)
+                return items, time.monotonic() - part_start
+        
+        return await asyncio.gather(*(run(body, count) for body, count in zip(bodies, counts)))
+    
+    def get_fanout_stats(self):
+        """Wall-clock time and summed part latencies of recent fanned-out requests"""
+        return list(self.fanout_stats)
+    
+    def get_topup_stats(self):
+        """How often short AI answers were topped up, and how many questions that recovered"""
+        return dict(self.topup_stats)
+    
     def generate_ai_worksheet(self, topic, grade, num_questions):
         """Generate worksheet using AI"""
         # Check if AI is working first
         if self.is_ai_working():
-            prompt = self._create_ai_prompt("Math", topic, grade, num_questions)
-            result = self._call_ai(prompt)
-            
+            result = self._ai_questions(self._prompt_body("Math", topic, grade, num_questions), num_questions)
             if result:
-                questions, answers = self._parse_ai_response(result)
-                if questions and answers:
-                    return questions, answers
-                elif result:
-                    print("[!] AI parsing failed, returning template")
-                    return self.generate_questions("บวก (+)", num_questions, 1, 100)
+                return result
         
         # Fallback to template generation
         print("[INFO] AI not working, using template generation")
@@ -165,118 +650,169 @@ Answers:
     
     def generate_science_worksheet(self, topic, grade, num_questions):
         """Generate science worksheet using AI"""
-        if self.is_ai_working():
-            prompt = self._create_ai_prompt("Science", topic, grade, num_questions)
-            result = self._call_ai(prompt)
-            
-            if result:
-                questions, answers = self._parse_ai_response(result)
-                if questions and answers:
-                    return questions, answers
-                elif result:
-                    print("[!] AI parsing failed, returning template")
-                    return [f"คำถามเกี่ยวกับ {topic}" for _ in range(num_questions)], [f"คำตอบสำหรับ {topic}" for _ in range(num_questions)]
-        
-        # Fallback to template generation
-        print("[INFO] Using template generation")
-        return [f"คำถามเกี่ยวกับ {topic}" for _ in range(num_questions)], [f"คำตอบสำหรับ {topic}" for _ in range(num_questions)]
+        return self._generate_subject_worksheet("Science", topic, grade, num_questions)
     
     def generate_chemistry_worksheet(self, topic, grade, num_questions):
         """Generate chemistry worksheet using AI"""
-        if self.is_ai_working():
-            prompt = self._create_ai_prompt("Chemistry", topic, grade, num_questions)
-            result = self._call_ai(prompt)
-            
-            if result:
-                questions, answers = self._parse_ai_response(result)
-                if questions and answers:
-                    return questions, answers
-                elif result:
-                    # AI returned something but parsing failed - return raw format
-                    print("[!] AI parsing failed, returning formatted raw content")
-                    return [f"คำถามเกี่ยวกับ {topic}" for _ in range(num_questions)], [f"คำตอบ" for _ in range(num_questions)]
-        
-        print("[INFO] Using template generation")
-        return [f"คำถามเคมีเกี่ยวกับ {topic}" for _ in range(num_questions)], [f"คำตอบ" for _ in range(num_questions)]
+        return self._generate_subject_worksheet("Chemistry", topic, grade, num_questions)
     
     def generate_physics_worksheet(self, topic, grade, num_questions):
         """Generate physics worksheet using AI"""
-        if self.is_ai_working():
-            prompt = self._create_ai_prompt("Physics", topic, grade, num_questions)
-            result = self._call_ai(prompt)
-            
-            if result:
-                questions, answers = self._parse_ai_response(result)
-                if questions and answers:
-                    return questions, answers
-                elif result:
-                    print("[!] AI parsing failed, returning template")
-                    return [f"คำถามฟิสิกส์เกี่ยวกับ {topic}" for _ in range(num_questions)], [f"คำตอบ" for _ in range(num_questions)]
-        
-        print("[INFO] Using template generation")
-        return [f"คำถามฟิสิกส์เกี่ยวกับ {topic}" for _ in range(num_questions)], [f"คำตอบ" for _ in range(num_questions)]
+        return self._generate_subject_worksheet("Physics", topic, grade, num_questions)
     
     def generate_biology_worksheet(self, topic, grade, num_questions):
         """Generate biology worksheet using AI"""
-        if self.is_ai_working():
-            prompt = self._create_ai_prompt("Biology", topic, grade, num_questions)
-            result = self._call_ai(prompt)
+        return self._generate_subject_worksheet("Biology", topic, grade, num_questions)
+    
+    def _generate_subject_worksheet(self, subject, topic, grade, num_questions, exercise_type="mix"):
+        """Collect a streamed subject worksheet into (questions, answers) lists"""
+        pairs = list(self.stream_subject_worksheet(subject, topic, grade, num_questions, exercise_type))
+        return [q for q, _ in pairs], [a for _, a in pairs]
+    
+    def stream_subject_worksheet(self, subject, topic, grade, num_questions, exercise_type="mix"):
+        """Yield (question, answer) pairs as soon as the AI produces each one.
+        
+        The completion is capped at a token budget sized to num_questions, and
+        the stream is closed as soon as num_questions pairs have been parsed,
+        so the model stops generating extra questions or closing commentary.
+        If the stream ends with fewer pairs, only the missing ones are requested.
+        Falls back to template questions if the AI produced nothing.
+        
+        Identical requests already streaming (from any session) are coalesced
+        like _call_ai's: the followers wait for the leader's full text and
+        parse it. Streams are not hedged; a backup provider would have to
+        restart the answer from the beginning.
+        """
+        produced = 0
+        streamed_questions = []
+        if self.is_ai_working() and hasattr(self.ai, 'generate_stream'):
+            prompt = self._create_ai_prompt(subject, topic, grade, num_questions, exercise_type, output_format="interleaved")
+            model = self._model_key()
+            max_tokens = self._max_tokens_for(num_questions)
+            cached = self.response_cache.get(prompt, self.provider, model) if self.response_cache else None
+            flight = get_ai_flight()
+            flight_key = call = None
+            leader = False
+            if cached is not None:
+                chunks = iter([cached])
+            else:
+                flight_key = make_cache_key(prompt, self.provider, model)
+                call, leader = flight.join(flight_key)
+                if leader:
+                    chunks = self.ai.generate_stream(prompt, session_id=self.session_id, max_tokens=max_tokens)
+                else:
+                    shared = flight.wait(call)
+                    chunks = iter([shared] if shared else [])
+            parser = StreamingQAParser()
+            text = []
+            stopped_early = False
+            try:
+                for chunk in chunks:
+                    text.append(chunk)
+                    for pair in parser.feed(chunk)[:num_questions - produced]:
+                        produced += 1
+                        streamed_questions.append(pair[0])
+                        yield pair
+                    if produced >= num_questions:
+                        stopped_early = True
+                        break
+                else:
+                    for pair in parser.close()[:num_questions - produced]:
+                        produced += 1
+                        streamed_questions.append(pair[0])
+                        yield pair
+            finally:
+                # Closing the provider stream ends generation on the server side
+                if hasattr(chunks, 'close'):
+                    chunks.close()
+                if leader:
+                    flight.finish(flight_key, call, "".join(text) or None)
+            # Only the leader's own stream is counted and cached
+            if leader:
+                self._record_token_usage(subject, num_questions, produced, max_tokens, "".join(text), stopped_early)
+                if produced and self.response_cache:
+                    self.response_cache.put(prompt, self.provider, model, "".join(text))
             
-            if result:
-                questions, answers = self._parse_ai_response(result)
-                if questions and answers:
-                    return questions, answers
-                elif result:
-                    print("[!] AI parsing failed, returning template")
-                    return [f"คำถามชีววิทยาเกี่ยวกับ {topic}" for _ in range(num_questions)], [f"คำตอบ" for _ in range(num_questions)]
+            if 0 < produced < num_questions:
+                body = self._prompt_body(subject, topic, grade, num_questions, exercise_type)
+                for pair in self._top_up(body, streamed_questions, [None] * produced, num_questions):
+                    produced += 1
+                    yield pair
         
-        print("[INFO] Using template generation")
-        return [f"คำถามชีววิทยาเกี่ยวกับ {topic}" for _ in range(num_questions)], [f"คำตอบ" for _ in range(num_questions)]
+        if not produced:
+            print("[INFO] Using template generation")
+            yield from zip(*self._template_worksheet(subject, topic, num_questions))
     
-    def generate_thai_worksheet(self, topic, grade, num_questions, exercise_type="mix"):
-        """Generate Thai worksheet using AI"""
+    def _record_token_usage(self, subject, num_questions, produced, max_tokens, text, stopped_early):
+        """Log completion tokens used, and the budget left unspent by stopping early"""
+        tokens_used = estimate_tokens(text, 0)
+        tokens_saved = max(0, max_tokens - tokens_used) if stopped_early else 0
+        self.token_stats.append({
+            "subject": subject,
+            "requested": num_questions,
+            "received": produced,
+            "max_tokens": max_tokens,
+            "tokens_used": tokens_used,
+            "tokens_saved": tokens_saved,
+            "stopped_early": stopped_early,
+        })
+        if stopped_early:
+            print(f"[INFO] Stopped {subject} generation after {produced} questions, ~{tokens_saved} tokens saved")
+    
+    def _template_worksheet(self, subject, topic, num_questions):
+        """Placeholder questions/answers for a subject"""
+        question, answer = TEMPLATE_QUESTIONS.get(subject, ("คำถามเกี่ยวกับ {topic}", "คำตอบ"))
+        return [question.format(topic=topic) for _ in range(num_questions)], \
+               [answer.format(topic=topic) for _ in range(num_questions)]
+    
+    async def agenerate_subject_worksheet(self, subject, topic, grade, num_questions, exercise_type="mix"):
+        """Generate one subject worksheet using AI without blocking the event loop"""
         if self.is_ai_working():
-            prompt = self._create_ai_prompt("Thai Language", topic, grade, num_questions, exercise_type)
-            result = self._call_ai(prompt)
-            
+            body = self._prompt_body(subject, topic, grade, num_questions, exercise_type)
+            loop = asyncio.get_running_loop()
+            result = await loop.run_in_executor(None, self._ai_questions, body, num_questions)
             if result:
-                questions, answers = self._parse_ai_response(result)
-                if questions and answers:
-                    return questions, answers
-                elif result:
-                    print("[!] AI parsing failed, returning template")
-                    return [f"แบบฝึกหัดภาษาไทยเกี่ยวกับ {topic}" for _ in range(num_questions)], [f"คำตอบ" for _ in range(num_questions)]
+                return result
         
         print("[INFO] Using template generation")
-        return [f"แบบฝึกหัดภาษาไทยเกี่ยวกับ {topic}" for _ in range(num_questions)], [f"คำตอบ" for _ in range(num_questions)]
+        return self._template_worksheet(subject, topic, num_questions)
+    
+    async def agenerate_worksheets(self, subjects, topic, grade, num_questions, max_concurrency=MAX_CONCURRENT_AI_CALLS):
+        """Generate several subject sections concurrently.
+        
+        Returns a dict of subject -> (questions, answers), in the order given.
+        """
+        semaphore = asyncio.Semaphore(max_concurrency)
+        
+        async def run(subject):
+            async with semaphore:
+                return await self.agenerate_subject_worksheet(subject, topic, grade, num_questions)
+        
+        results = await asyncio.gather(*(run(subject) for subject in subjects))
+        return dict(zip(subjects, results))
+    
+    def generate_combined_science_worksheet(self, topic, grade, num_questions, subjects=("Chemistry", "Physics", "Biology")):
+        """Generate chemistry/physics/biology sections concurrently and merge them"""
+        sections = asyncio.run(self.agenerate_worksheets(list(subjects), topic, grade, num_questions))
+        questions, answers = [], []
+        for subject, (section_questions, section_answers) in sections.items():
+            questions.extend(f"[{subject}] {q}" for q in section_questions)
+            answers.extend(section_answers)
+        return questions, answers
+    
+    def generate_thai_worksheet(self, topic, grade, num_questions, exercise_type="mix"):
+        """Generate Thai worksheet using AI"""
+        return self._generate_subject_worksheet("Thai Language", topic, grade, num_questions, exercise_type)
     
     def generate_english_worksheet(self, topic, grade, num_questions, exercise_type="mix"):
         """Generate English worksheet using AI"""
         if self.is_ai_working():
-            prompt = f"""Create {num_questions} English {exercise_type} exercises for Thai students.
+            body = f"""Create {num_questions} English {exercise_type} exercises for Thai students.
 Grade: {grade}
-Topic: {topic}
-
-Format:
-Questions:
-1. [question in English]
-2. [question in English]
-...
-
-Answers:
-1. [answer in English]
-2. [answer in English]
-..."""
-            
-            result = self._call_ai(prompt)
-            
+Topic: {topic}"""
+            result = self._ai_questions(body, num_questions, "question in English", "answer in English")
             if result:
-                questions, answers = self._parse_ai_response(result)
-                if questions and answers:
-                    return questions, answers
-                elif result:
-                    print("[!] AI parsing failed, returning template")
-                    return [f"{exercise_type} exercise about {topic}" for _ in range(num_questions)], [f"Answer" for _ in range(num_questions)]
+                return result
         
         print("[INFO] Using template generation")
         return [f"{exercise_type} exercise about {topic}" for _ in range(num_questions)], [f"Answer" for _ in range(num_questions)]
@@ -284,139 +820,207 @@ Answers:
     def generate_ai_word_problems(self, topic, grade, num_questions):
         """Generate AI word problems"""
         if self.is_ai_working():
-            prompt = f"""Create {num_questions} math word problems for Thai students.
+            body = f"""Create {num_questions} math word problems for Thai students.
 Grade: {grade}
 Topic: {topic}
 
-Make problems interesting and age-appropriate. Use Thai context.
-
-Format:
-Questions:
-1. [word problem in Thai]
-2. [word problem in Thai]
-...
-
-Answers:
-1. [answer with explanation]
-2. [answer with explanation]
-..."""
-            
-            result = self._call_ai(prompt)
-            
+Make problems interesting and age-appropriate. Use Thai context."""
+            result = self._ai_questions(body, num_questions, "word problem in Thai", "answer with explanation")
             if result:
-                questions, answers = self._parse_ai_response(result)
-                if questions and answers:
-                    return questions, answers
-                elif result:
-                    print("[!] AI parsing failed, returning template")
-                    return [f"โจทย์ปัญหาเรื่อง {topic}" for _ in range(num_questions)], [f"คำตอบ" for _ in range(num_questions)]
+                return result
         
         print("[INFO] Using template generation")
         return [f"โจทย์ปัญหาเรื่อง {topic}" for _ in range(num_questions)], [f"คำตอบ" for _ in range(num_questions)]
     
-    def generate_quiz_from_text(self, text, num_questions):
-        """Generate quiz questions from uploaded text"""
+    def generate_quiz_from_text(self, text, num_questions, topic=None, grade=None):
+        """Generate quiz questions from uploaded text.
+        
+        text may also be an iterable of extracted chunks (iter_text_from_file);
+        passage ranking needs the whole document, so it is read to the end first.
+        Text over QUIZ_CONTEXT_BUDGET tokens is first reduced to the passages
+        most relevant to topic (or, without it, the most informative ones);
+        grade only sets the level of the questions. Text over
+        QUIZ_CONTEXT_TOKENS is then quizzed chunk by chunk so all of it is
+        covered; otherwise more than FANOUT_THRESHOLD questions are generated
+        as concurrent parts.
+        """
+        if not isinstance(text, str):
+            text = "".join(chunk.text for chunk in text)
         if self.is_ai_working():
-            prompt = f"""Create {num_questions} quiz questions based on the following text.
-Generate questions that test comprehension.
-
-Text: {text[:2000]}
-
-Format:
-Questions:
-1. [question]
-2. [question]
-...
-
-Answers:
-1. [answer]
-2. [answer]
-..."""
-            
-            result = self._call_ai(prompt)
-            
+            text = self._select_quiz_context(text, topic)
+            if estimate_tokens(text, 0) > QUIZ_CONTEXT_TOKENS:
+                result = self._map_reduce_quiz(text, num_questions, grade)
+            elif num_questions > FANOUT_THRESHOLD:
+                result = self._fanout_questions(functools.partial(self._quiz_body, text, grade=grade), num_questions)
+            else:
+                result = self._ai_questions(self._quiz_body(text, num_questions, grade), num_questions)
             if result:
-                questions, answers = self._parse_ai_response(result)
-                if questions and answers:
-                    return questions, answers
+                return result
         
         print("[INFO] AI not working, using template generation")
         return ["คำถามจากบทความ"], ["คำตอบ"]
     
-    def _parse_ai_response(self, response):
-        """Parse AI response into questions and answers - support multiple formats"""
-        try:
-            # Try multiple formats
-            questions = []
-            answers = []
-            
-            # Format 1: "Questions:" and "Answers:"
-            if "Answers:" in response:
-                parts = response.split("Answers:")
-                if len(parts) >= 2:
-                    # Parse questions
-                    q_lines = [q.strip() for q in parts[0].split("\n") if q.strip() and not q.lower().startswith("questions:")]
-                    # Parse answers
-                    a_lines = [a.strip() for a in parts[1].split("\n") if a.strip()]
-                    
-                    
-                    # Extract question content (remove numbers)
-                    for q in q_lines:
-                        if q and (q[0].isdigit() or q.startswith("-")):
-                            q_clean = q.split(".", 1)[1].strip() if "." in q and q[0].isdigit() else q
-                            if q_clean:
-                                questions.append(q_clean)
-                    
-                    # Extract answer content
-                    for a in a_lines:
-                        if a and (a[0].isdigit() or a.startswith("-")):
-                            a_clean = a.split(".", 1)[1].strip() if "." in a and a[0].isdigit() else a
-                            if a_clean:
-                                answers.append(a_clean)
-                    
-                    if questions and answers:
-                        return questions, answers
-            
-            # Format 2: Just numbered list without "Answers:"
-            lines = response.split("\n")
-            current_section = "questions"
-            for line in lines:
-                line = line.strip()
-                if not line:
-                    continue
-                
-                # Check for answer section markers
-                lower_line = line.lower()
-                if any(marker in lower_line for marker in ["answer", "เฉลย", "solution"]):
-                    current_section = "answers"
-                    continue
-                
-                # Extract numbered items
-                if line[0].isdigit() and "." in line:
-                    content = line.split(".", 1)[1].strip()
-                    if current_section == "questions":
-                        questions.append(content)
-                    else:
-                        answers.append(content)
-                elif line.startswith("-") or line.startswith("•"):
-                    content = line[1:].strip()
-                    if current_section == "questions":
-                        questions.append(content)
-                    else:
-                        answers.append(content)
-            
-            # If we have both, return them
-            if questions and answers:
-                return questions, answers
-            
-            # If we only have questions, create dummy answers
-            if questions:
-                answers = [f"คำตอบที่ {i+1}" for i in range(len(questions))]
-                return questions, answers
-            
-        except Exception as e:
-            print(f"[!] Error parsing AI response: {e}")
+    def _select_quiz_context(self, text, topic=None, budget_tokens=QUIZ_CONTEXT_BUDGET):
+        """Text cut down to its best passages within budget_tokens, in document order.
         
+        Only the topic is used as the query: a grade label such as "ม.4"
+        tokenizes to a bare digit that matches passages by accident.
+        """
+        if estimate_tokens(text, 0) <= budget_tokens:
+            return text
+        query = topic or ""
+        passages = select_passages(text, query, budget_tokens)
+        if not passages:
+            return text
+        selected = "\n\n".join(passage.text for passage in passages)
+        print(f"[INFO] Quiz context: {len(passages)} passages, {len(selected)}/{len(text)} chars"
+              f"{f' for {query!r}' if query else ''}")
+        return selected
+    
+    def _map_chunks(self, text, max_chunks=MAP_MAX_CHUNKS):
+        """Token-budgeted chunks for the map step, at most max_chunks of them"""
+        total = estimate_tokens(text, 0)
+        chunk_tokens = min(MAP_MAX_CHUNK_TOKENS, max(QUIZ_CONTEXT_TOKENS, -(-total // max_chunks)))
+        chunks = chunk_text(text, chunk_tokens)
+        if len(chunks) > max_chunks:
+            # Too long even at the largest chunk size: sample evenly across the document
+            step = len(chunks) / max_chunks
+            chunks = [chunks[int(i * step)] for i in range(max_chunks)]
+        return chunks
+    
+    def _map_reduce_quiz(self, text, num_questions, grade=None):
+        """Quiz over a long document: candidate questions per chunk in parallel, then a balanced pick.
+        
+        Each chunk gets a quota proportional to its length, so every part of the
+        document is represented; unused candidates fill any gaps. The result is
+        in document order. Returns (questions, answers) or None.
+        """
+        # No more map requests than questions asked for
+        chunks = self._map_chunks(text, min(MAP_MAX_CHUNKS, max(1, num_questions)))
+        total = sum(len(chunk.text) for chunk in chunks)
+        quotas = _proportional_quotas([len(chunk.text) for chunk in chunks], num_questions)
+        counts = [max(1, round(quota * MAP_OVERSAMPLE)) for quota in quotas]
+        bodies = [
+            f"{self._quiz_body(chunk.text, count, grade)}\n\n"
+            f"(This passage is part {i + 1} of {len(chunks)} of a longer document; ask only about this passage.)"
+            for i, (chunk, count) in enumerate(zip(chunks, counts))
+        ]
+        start = time.monotonic()
+        results = asyncio.run(self._afanout(bodies, counts, "question", "answer", MAP_MAX_CONCURRENCY))
+        
+        # Reduce: each chunk's quota first, then leftovers round-robin across chunks
+        seen = set()
+        candidates = []
+        for items, _ in results:
+            unique = []
+            for item in items or []:
+                key = _question_key(item.text)
+                if item.answer is not None and key not in seen:
+                    seen.add(key)
+                    unique.append(item)
+            candidates.append(unique)
+        picked = [pool[:quota] for pool, quota in zip(candidates, quotas)]
+        leftovers = [pool[quota:] for pool, quota in zip(candidates, quotas)]
+        shortfall = num_questions - sum(len(p) for p in picked)
+        while shortfall > 0 and any(leftovers):
+            for i, pool in enumerate(leftovers):
+                if pool and shortfall > 0:
+                    picked[i].append(pool.pop(0))
+                    shortfall -= 1
+        
+        questions = [item.text for part in picked for item in part]
+        answers = [item.answer for part in picked for item in part]
+        if not questions:
+            return None
+        if len(questions) < num_questions:
+            # Top up from the chunk that is furthest below its quota
+            gaps = [quota - len(part) for part, quota in zip(picked, quotas)]
+            weakest = chunks[gaps.index(max(gaps))]
+            self._top_up(self._quiz_body(weakest.text, num_questions, grade), questions, answers, num_questions)
+        
+        covered = sum(1 for part in picked if part)
+        print(f"[INFO] Map-reduce quiz: {len(questions)}/{num_questions} questions from {len(chunks)} chunks "
+              f"({total} chars, {covered} chunks covered) in {time.monotonic() - start:.1f}s")
+        return questions, answers
+    
+    def _quiz_body(self, text, num_questions, grade=None):
+        """Task prompt for a quiz of num_questions questions on text (pitched at grade, if given)"""
+        level = f"\nPitch the questions at {grade} level." if grade else ""
+        return f"""Create {num_questions} quiz questions based on the following text.
+Generate questions that test comprehension.{level}
+
+Text: {text}"""
+    
+    # ===== Summaries =====
+    def summarize_text(self, text, max_length=2000):
+        """Summarize text to about max_length characters, in Thai.
+        
+        Long text is summarized hierarchically: token-budgeted chunks are
+        summarized in parallel, then the partial summaries are merged, so any
+        length fits the context window. Each summary is cached under the hash
+        of its input, so the same chapter is only summarized once.
+        text may also be an iterable of extracted chunks (iter_text_from_file):
+        chunks are then summarized while the rest of the file is still being read.
+        Without AI, the start of the text is returned.
+        """
+        if isinstance(text, str) or text is None:
+            chunks = iter(chunk_text((text or "").strip(), SUMMARY_CHUNK_TOKENS))
+        else:
+            chunks = chunk_stream(text, SUMMARY_CHUNK_TOKENS)
+        first = next(chunks, None)
+        if first is None:
+            return ""
+        second = next(chunks, None)
+        if not self.is_ai_working():
+            return first.text[:max_length]
+        if second is None:
+            return self._summarize_piece(first.text, max_length) or first.text[:max_length]
+        
+        # Part length does not depend on the chunk count, so a chapter's cached
+        # summary is reused whatever document it turns up in
+        part_chars = min(SUMMARY_MAX_PART_CHARS, max(SUMMARY_MIN_PART_CHARS, max_length // 2))
+        with ThreadPoolExecutor(max_workers=SUMMARY_MAX_CONCURRENCY) as pool:
+            jobs = [(chunk, pool.submit(self._summarize_piece, chunk.text, part_chars))
+                    for chunk in itertools.chain((first, second), chunks)]
+        # A chunk the AI failed on is represented by its opening instead
+        partials = [job.result() or chunk.text[:part_chars] for chunk, job in jobs]
+        print(f"[INFO] Summarized {len(jobs)} chunks ({jobs[-1][0].end - first.start} chars) "
+              f"into {sum(map(len, partials))} chars")
+        return self.summarize_text("\n\n".join(partials), max_length)
+    
+    def _summarize_piece(self, text, max_chars):
+        """One summary request, cached by a hash of the text and target length"""
+        content_hash = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        cache_key = f"{max_chars}:{content_hash}"
+        if self.response_cache:
+            cached = self.response_cache.get(cache_key, SUMMARY_CACHE_NAMESPACE, None)
+            if cached is not None:
+                return cached
+        
+        prompt = f"""Summarize the following text in Thai for teachers and students.
+Keep the key concepts, definitions, facts and examples; use short paragraphs or bullet points.
+Write no more than {max_chars} characters.
+
+Text: {text}"""
+        result = self._call_ai(prompt, max_chars // CHARS_PER_TOKEN + MAX_TOKENS_OVERHEAD, use_cache=False)
+        if result:
+            result = result.strip()
+            if self.response_cache:
+                self.response_cache.put(cache_key, SUMMARY_CACHE_NAMESPACE, None, result)
+        return result
+    
+    def _parse_ai_response(self, response, num_questions=1):
+        """Parse AI response into questions and answers - support multiple formats (one pass)"""
+        return self._with_placeholders(parse_questions(response or ""), num_questions)
+    
+    def _with_placeholders(self, items, num_questions):
+        """Questions/answers lists from parsed items, filling in whatever is missing"""
+        if items:
+            # Questions the AI left unanswered get placeholder answers
+            return [item.text for item in items], \
+                   [item.answer if item.answer is not None else f"คำตอบที่ {i+1}" for i, item in enumerate(items)]
+        
+        print("[!] Could not parse AI response")
         # Ultimate fallback - always return something
         return [f"คำถามที่ {i+1}" for i in range(num_questions)], [f"คำตอบที่ {i+1}" for i in range(num_questions)]
     
@@ -443,19 +1047,4 @@ Answers:
     
     def generate_social_studies_worksheet(self, topic, grade, num_questions, exercise_type="mix"):
         """Generate Social Studies worksheet using AI"""
-        if self.is_ai_working():
-            prompt = self._create_ai_prompt("Social Studies", topic, grade, num_questions, exercise_type)
-            result = self._call_ai(prompt)
-            
-            if result:
-                questions, answers = self._parse_ai_response(result)
-                if questions and answers:
-                    return questions, answers
-                elif result:
-                    print("[!] AI parsing failed, returning template")
-                    return [f"คำถามสังคมศึกษาเกี่ยวกับ {topic}" for _ in range(num_questions)], \
-                           [f"คำตอบสำหรับ {topic}" for _ in range(num_questions)]
-        
-        print("[INFO] Using template generation")
-        return [f"คำถามสังคมศึกษาเกี่ยวกับ {topic}" for _ in range(num_questions)], \
-               [f"คำตอบสำหรับ {topic}" for _ in range(num_questions)]
+        return self._generate_subject_worksheet("Social Studies", topic, grade, num_questions, exercise_type)
@@ -0,0 +1,88 @@
+# bench_docx_extraction.py - Streaming .docx extraction (iterparse) vs python-docx's object model
+# Usage: python benchmarks/bench_docx_extraction.py [docx_path | paragraphs]
+#   Without a file, a document with the given number of paragraphs (default 20000)
+#   and one 10-row table per 20 paragraphs is generated with python-docx.
+import io
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from docx import Document
+
+from backend.document_text import extract_document_text
+
+LINE = "ข้อ {i}. พืชใช้แสงในการสังเคราะห์อาหาร Plants use light to make food (paragraph {i})."
+
+
+class Upload(io.BytesIO):
+    """Stands in for a Streamlit UploadedFile"""
+    name = "worksheet.docx"
+
+
+def build_docx(paragraphs):
+    doc = Document()
+    for i in range(paragraphs):
+        doc.add_paragraph(LINE.format(i=i))
+        if i % 20 == 19:
+            table = doc.add_table(rows=10, cols=3)
+            for r, row in enumerate(table.rows):
+                for c, cell in enumerate(row.cells):
+                    cell.text = f"ตาราง {i} แถว {r} คอลัมน์ {c}"
+    buffer = io.BytesIO()
+    doc.save(buffer)
+    return buffer.getvalue()
+
+
+def python_docx_paragraphs(data):
+    """The previous extractor: body paragraphs only"""
+    doc = Document(Upload(data))
+    return "".join(para.text + "\n" for para in doc.paragraphs)
+
+
+def python_docx_with_tables(data):
+    """python-docx doing the same job as the streaming extractor, for a like-for-like comparison"""
+    doc = Document(Upload(data))
+    parts = []
+    for block in doc.iter_inner_content():
+        if hasattr(block, "rows"):
+            for row in block.rows:
+                parts.append(" | ".join(cell.text for cell in row.cells) + "\n")
+        else:
+            parts.append(block.text + "\n")
+    return "".join(parts)
+
+
+def streaming(data):
+    return extract_document_text(Upload(data))
+
+
+def measure(label, extract, data):
+    start = time.perf_counter()
+    text = extract(data)
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    extract(data)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{label:<24} {elapsed:>8.2f}s {peak / 1e6:>9.1f} MB {len(text):>10}")
+
+
+def main():
+    arg = sys.argv[1] if len(sys.argv) > 1 else "20000"
+    if os.path.isfile(arg):
+        with open(arg, "rb") as f:
+            data = f.read()
+    else:
+        data = build_docx(int(arg))
+    print(f"{len(data) / 1e6:.1f} MB .docx")
+    print(f"{'':<24} {'time':>9} {'peak mem':>12} {'chars':>10}")
+    measure("python-docx paragraphs", python_docx_paragraphs, data)
+    measure("python-docx + tables", python_docx_with_tables, data)
+    measure("streaming iterparse", streaming, data)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+# bench_extraction.py - Streaming page-wise extraction vs building the whole text with +=
+# Usage: python benchmarks/bench_extraction.py [pdf_path | page_count]
+#   Without a PDF, one of page_count pages (default 300) is generated with reportlab.
+import io
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pypdf import PdfReader
+
+from backend.document_text import iter_document_text
+from backend.text_chunks import chunk_stream
+
+LINE = "Photosynthesis converts light energy into chemical energy stored in glucose. "
+
+
+def build_pdf(pages):
+    from reportlab.lib.pagesizes import A4
+    from reportlab.pdfgen import canvas
+
+    buffer = io.BytesIO()
+    c = canvas.Canvas(buffer, pagesize=A4)
+    for page in range(pages):
+        for line in range(45):
+            c.drawString(40, 800 - line * 17, f"{page + 1}.{line + 1} {LINE}")
+        c.showPage()
+    c.save()
+    return buffer.getvalue()
+
+
+class Upload(io.BytesIO):
+    """Stands in for a Streamlit UploadedFile"""
+    name = "textbook.pdf"
+
+
+def legacy_extract(data):
+    """The previous backend.py extractor"""
+    text = ""
+    reader = PdfReader(Upload(data))
+    for page in reader.pages:
+        text += page.extract_text() + "\n"
+    yield text
+
+
+def streamed_extract(data):
+    yield from chunk_stream(iter_document_text(Upload(data)))
+
+
+def measure(label, extract, data):
+    tracemalloc.start()
+    start = time.perf_counter()
+    first = None
+    chars = 0
+    for chunk in extract(data):
+        if first is None:
+            first = time.perf_counter() - start
+        # Consumers keep only what they need; the chunk itself is dropped here
+        chars += len(chunk if isinstance(chunk, str) else chunk.text)
+    total = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{label:<10} {first:>10.2f}s {total:>8.2f}s {peak / 1e6:>9.1f} MB {chars:>10}")
+
+
+def main():
+    arg = sys.argv[1] if len(sys.argv) > 1 else "300"
+    if os.path.isfile(arg):
+        with open(arg, "rb") as f:
+            data = f.read()
+    else:
+        data = build_pdf(int(arg))
+    print(f"{len(data) / 1e6:.1f} MB PDF")
+    print(f"{'':<10} {'1st chunk':>11} {'total':>9} {'peak mem':>12} {'chars':>10}")
+    measure("legacy", legacy_extract, data)
+    measure("streamed", streamed_extract, data)
+
+
+if __name__ == "__main__":
+    main()
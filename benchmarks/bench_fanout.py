@@ -0,0 +1,69 @@
+# bench_fanout.py - Wall-clock time of one large quiz request vs fanned-out concurrent parts
+# Usage: python benchmarks/bench_fanout.py [seconds_per_question]
+#   The simulated provider takes 0.5 s to first token plus seconds_per_question (default 0.1)
+#   for each question it writes, roughly how output length drives real model latency.
+import os
+import re
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend.ai_providers import BaseProvider
+from backend.rate_limiter import RequestScheduler
+from backend.worksheet_generator import WorksheetGenerator
+
+FIRST_TOKEN_SECONDS = 0.5
+TEXT = "การสังเคราะห์ด้วยแสงเป็นกระบวนการที่พืชใช้พลังงานแสงเปลี่ยนคาร์บอนไดออกไซด์และน้ำเป็นน้ำตาล " * 20
+
+
+class SimulatedProvider(BaseProvider):
+    """Answers any quiz prompt after a delay proportional to the number of questions asked for"""
+    name = "Simulated"
+
+    def __init__(self, seconds_per_question):
+        self.seconds_per_question = seconds_per_question
+        super().__init__("benchmark")
+        self.scheduler = RequestScheduler()
+
+    def _library_available(self):
+        return True
+
+    def _create_client(self):
+        return object()
+
+    def _probe(self):
+        pass
+
+    def _generate(self, prompt, max_tokens=None, json_schema=None):
+        count = int(re.search(r"Create (\d+)", prompt).group(1))
+        time.sleep(FIRST_TOKEN_SECONDS + self.seconds_per_question * count)
+        tag = uuid.uuid4().hex[:6]
+        return "\n".join(f"Q: คำถาม {tag}-{i}\nA: คำตอบ {i}" for i in range(1, count + 1))
+
+
+def timed(fn):
+    start = time.monotonic()
+    questions, _ = fn()
+    return time.monotonic() - start, len(questions)
+
+
+def main():
+    seconds_per_question = float(sys.argv[1]) if len(sys.argv) > 1 else 0.1
+    generator = WorksheetGenerator(use_cache=False)
+    generator.ai = SimulatedProvider(seconds_per_question)
+
+    print(f"{'questions':>9} {'single-shot':>12} {'fan-out':>9} {'parts':>6} {'speedup':>8}")
+    for num_questions in (10, 20, 30, 50):
+        single, _ = timed(lambda: generator._ai_questions(generator._quiz_body(TEXT, num_questions), num_questions))
+        if num_questions > 15:
+            fanned, _ = timed(lambda: generator.generate_quiz_from_text(TEXT, num_questions))
+            parts = generator.get_fanout_stats()[-1]["parts"]
+        else:
+            fanned, parts = single, 1
+        print(f"{num_questions:>9} {single:>11.2f}s {fanned:>8.2f}s {parts:>6} {single / fanned:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+# bench_gemini_client.py - Per-call latency: new Gemini client per call vs one pooled client
+# Usage: python benchmarks/bench_gemini_client.py [num_calls]
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from google import genai
+from google.genai import types
+from backend.ai_providers import GoogleProvider
+from backend.rate_limiter import RequestScheduler
+
+MODELS_RESPONSE = {
+    "models": [
+        {"name": "models/gemini-1.5-flash", "supportedGenerationMethods": ["generateContent"]},
+    ]
+}
+GENERATE_RESPONSE = {
+    "candidates": [
+        {"content": {"role": "model", "parts": [{"text": "Questions:\n1. 1 + 1\n\nAnswers:\n1. 2"}]}},
+    ]
+}
+
+
+class FakeGeminiHandler(BaseHTTPRequestHandler):
+    """Minimal stand-in for the Gemini REST API (keep-alive enabled)"""
+    protocol_version = "HTTP/1.1"
+
+    def _send_json(self, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        self._send_json(MODELS_RESPONSE)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        self.rfile.read(length)
+        self._send_json(GENERATE_RESPONSE)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))
+    return values[index]
+
+
+def report(label, timings):
+    ms = [t * 1000 for t in timings]
+    print(f"{label:<28} mean {sum(ms) / len(ms):7.2f} ms   p50 {percentile(ms, 50):7.2f} ms   p99 {percentile(ms, 99):7.2f} ms")
+
+
+def main():
+    num_calls = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeGeminiHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    model = "models/gemini-1.5-flash"
+
+    # Before: a fresh client (and HTTP session) for every prompt
+    per_call = []
+    for _ in range(num_calls):
+        start = time.perf_counter()
+        client = genai.Client(api_key="fake-key", http_options=types.HttpOptions(base_url=base_url))
+        client.models.generate_content(model=model, contents="test")
+        per_call.append(time.perf_counter() - start)
+
+    # After: one pooled client owned by the provider
+    provider = GoogleProvider("fake-key", base_url=base_url)
+    provider.scheduler = RequestScheduler()  # measure the client, not the free-tier rate limit
+    provider.model = model
+    provider.is_working = True
+    pooled = []
+    for _ in range(num_calls):
+        start = time.perf_counter()
+        provider.generate("test")
+        pooled.append(time.perf_counter() - start)
+
+    print(f"{num_calls} calls against {base_url}")
+    report("new client per call", per_call)
+    report("persistent pooled client", pooled)
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,37 @@
+# bench_parallel_extraction.py - PDF text extraction time by page count: one process vs a process pool
+# Usage: python benchmarks/bench_parallel_extraction.py [workers]
+#   workers defaults to the number used in production (pdf_workers()), but at least 2.
+#   The pool is started once before timing, as it is in the long-running server.
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend.document_text import PARALLEL_MIN_PAGES, extract_document_text, pdf_workers
+
+from bench_extraction import Upload, build_pdf
+
+
+def timed(data, workers):
+    start = time.perf_counter()
+    text = extract_document_text(Upload(data), workers)
+    return time.perf_counter() - start, len(text)
+
+
+def main():
+    workers = int(sys.argv[1]) if len(sys.argv) > 1 else max(2, pdf_workers())
+    print(f"{os.cpu_count()} CPUs, {workers} workers, parallel from {PARALLEL_MIN_PAGES} pages")
+    timed(build_pdf(PARALLEL_MIN_PAGES), workers)  # start the worker processes
+
+    print(f"{'pages':>6} {'1 process':>10} {'pool':>8} {'speedup':>8}")
+    for pages in (20, 50, 100, 200):
+        data = build_pdf(pages)
+        single, single_chars = timed(data, 1)
+        pooled, pooled_chars = timed(data, workers)
+        assert single_chars == pooled_chars
+        print(f"{pages:>6} {single:>9.2f}s {pooled:>7.2f}s {single / pooled:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+# bench_response_parser.py - Throughput of the single-pass response parser vs the old multi-pass one
+# Usage: python benchmarks/bench_response_parser.py [corpus_dir] [rounds]
+#   corpus_dir: folder of recorded AI responses (*.txt); a built-in corpus is used if omitted
+import glob
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend.response_parser import StreamingQAParser, parse_questions
+
+
+def build_corpus():
+    """Responses in every format the providers have been seen to produce"""
+    corpus = []
+    for n in (5, 10, 30, 50):
+        corpus.append("Questions:\n" + "\n".join(f"{i}. **คำถามวิทยาศาสตร์ข้อที่ {i} เกี่ยวกับการสังเคราะห์ด้วยแสง**" for i in range(1, n + 1))
+                      + "\n\nAnswers:\n" + "\n".join(f"{i}. คำตอบข้อที่ {i} คือคลอโรฟิลล์" for i in range(1, n + 1))
+                      + "\n\nหวังว่าแบบฝึกหัดนี้จะเป็นประโยชน์!")
+        corpus.append("\n".join(f"Q: What is {i} + {i}?\nA: {2 * i}" for i in range(1, n + 1)))
+        corpus.append("\n".join(f"Q: ข้อใดเป็นสัตว์เลี้ยงลูกด้วยนม ({i})\nA: ปลาทู\nB: แมว\nC: กบ\nD: จระเข้\nAns: B"
+                                for i in range(1, n + 1)))
+        corpus.append("แบบฝึกหัด\n" + "\n".join(f"{i}. ประเทศไทยมีกี่ภาค ({i})\nก. 4\nข. 5\nค. 6\nง. 7" for i in range(1, n + 1))
+                      + "\nเฉลย\n" + "\n".join(f"{i}. ค" for i in range(1, n + 1)))
+    return corpus
+
+
+def load_corpus(directory):
+    corpus = []
+    for path in sorted(glob.glob(os.path.join(directory, "*.txt"))):
+        with open(path, "r", encoding="utf-8") as f:
+            corpus.append(f.read())
+    return corpus
+
+
+def legacy_parse(response):
+    """The previous WorksheetGenerator._parse_ai_response, for comparison"""
+    questions = []
+    answers = []
+    if "Answers:" in response:
+        parts = response.split("Answers:")
+        if len(parts) >= 2:
+            q_lines = [q.strip() for q in parts[0].split("\n") if q.strip() and not q.lower().startswith("questions:")]
+            a_lines = [a.strip() for a in parts[1].split("\n") if a.strip()]
+            for q in q_lines:
+                if q and (q[0].isdigit() or q.startswith("-")):
+                    q_clean = q.split(".", 1)[1].strip() if "." in q and q[0].isdigit() else q
+                    if q_clean:
+                        questions.append(q_clean)
+            for a in a_lines:
+                if a and (a[0].isdigit() or a.startswith("-")):
+                    a_clean = a.split(".", 1)[1].strip() if "." in a and a[0].isdigit() else a
+                    if a_clean:
+                        answers.append(a_clean)
+            if questions and answers:
+                return questions, answers
+    current_section = "questions"
+    for line in response.split("\n"):
+        line = line.strip()
+        if not line:
+            continue
+        lower_line = line.lower()
+        if any(marker in lower_line for marker in ["answer", "เฉลย", "solution"]):
+            current_section = "answers"
+            continue
+        if line[0].isdigit() and "." in line:
+            content = line.split(".", 1)[1].strip()
+            (questions if current_section == "questions" else answers).append(content)
+        elif line.startswith("-") or line.startswith("•"):
+            content = line[1:].strip()
+            (questions if current_section == "questions" else answers).append(content)
+    return questions, answers
+
+
+def stream_parse(response, chunk_size=32):
+    """Feed the response in small chunks, as a provider stream would"""
+    parser = StreamingQAParser()
+    pairs = []
+    for i in range(0, len(response), chunk_size):
+        pairs.extend(parser.feed(response[i:i + chunk_size]))
+    pairs.extend(parser.close())
+    return pairs
+
+
+def answered(result):
+    if isinstance(result, tuple):
+        questions, answers = result
+        return min(len(questions), len(answers))
+    if result and isinstance(result[0], tuple):
+        return len(result)
+    return sum(1 for item in result if item.answer is not None)
+
+
+def bench(label, fn, corpus, rounds):
+    total_bytes = sum(len(r.encode("utf-8")) for r in corpus)
+    pairs = sum(answered(fn(r)) for r in corpus)
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for response in corpus:
+            fn(response)
+    elapsed = time.perf_counter() - start
+    responses = rounds * len(corpus)
+    print(f"{label:<22} {responses / elapsed:>10.0f} resp/s  {total_bytes * rounds / elapsed / 1e6:>7.1f} MB/s"
+          f"  {pairs:>5} Q/A pairs recovered")
+
+
+def main():
+    args = sys.argv[1:]
+    corpus = load_corpus(args[0]) if args and os.path.isdir(args[0]) else build_corpus()
+    rounds = int(args[-1]) if args and args[-1].isdigit() else 200
+    print(f"{len(corpus)} responses, {rounds} rounds")
+    bench("legacy multi-pass", legacy_parse, corpus, rounds)
+    bench("single-pass", parse_questions, corpus, rounds)
+    bench("single-pass streamed", stream_parse, corpus, rounds)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+# bench_upload_memory.py - Peak RSS and time for concurrent PDF uploads: in-memory parsing vs spooled+mmap with a page range
+# Usage: python benchmarks/bench_upload_memory.py [pages] [uploads] [page_range]
+#   Defaults: a generated 1000-page PDF, 4 simultaneous uploads, pages "1-20".
+#   Each mode runs in a fresh process so peak RSS figures are independent.
+import os
+import resource
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pypdf import PdfReader
+
+from backend.document_text import extract_document_text
+
+from bench_extraction import Upload, build_pdf
+
+PDF_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "_upload_memory.pdf")
+
+
+def legacy_extract(data, page_range):
+    """Parse the upload from memory and decode every page, as before"""
+    reader = PdfReader(Upload(data))
+    return "".join(page.extract_text() + "\n" for page in reader.pages)
+
+
+def run_mode(mode, uploads, page_range):
+    with open(PDF_PATH, "rb") as f:
+        data = f.read()
+    if mode == "in-memory":
+        extract = legacy_extract
+    else:
+        def extract(data, page_range):
+            return extract_document_text(Upload(data), workers=1, pages=page_range if mode == "page range" else None)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=uploads) as pool:
+        chars = sum(len(text) for text in pool.map(extract, [data] * uploads, [page_range] * uploads))
+    elapsed = time.perf_counter() - start
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"{mode:<12} {elapsed:>8.2f}s {peak_mb:>10.1f} MB {chars:>10}")
+
+
+def main():
+    args = sys.argv[1:]
+    if args and args[0] == "--mode":
+        run_mode(args[1], int(args[2]), args[3])
+        return
+    pages = int(args[0]) if args else 1000
+    uploads = int(args[1]) if len(args) > 1 else 4
+    page_range = args[2] if len(args) > 2 else "1-20"
+    with open(PDF_PATH, "wb") as f:
+        f.write(build_pdf(pages))
+    try:
+        print(f"{os.path.getsize(PDF_PATH) / 1e6:.1f} MB PDF, {pages} pages, {uploads} simultaneous uploads")
+        print(f"{'':<12} {'time':>9} {'peak RSS':>13} {'chars':>10}")
+        for mode in ("in-memory", "spooled", "page range"):
+            subprocess.run([sys.executable, os.path.abspath(__file__), "--mode", mode, str(uploads), page_range], check=True)
+    finally:
+        os.remove(PDF_PATH)
+
+
+if __name__ == "__main__":
+    main()